@@ -0,0 +1,292 @@
+"""Concurrent multi-keyword scraping on a pool of Playwright browser contexts.
+
+One browser is launched per run; each keyword is scraped in its own
+context taken from a bounded pool, with requests to the same host paced
+by the process-wide pacer (see pacer.py). With pagination="url"
+the result pages of a keyword are opened directly by URL in several tabs
+at once instead of clicking "next".
+"""
+import asyncio
+import random
+from playwright.async_api import async_playwright
+from card_parser import CARD_CLASS, parse_listing_json, unique_products
+from config import (LAZADA_DB_NAME, LAZADA_PARSER_BACKEND, LAZADA_CONCURRENCY, LAZADA_PAGINATION,
+                    LAZADA_PAGE_TABS, LAZADA_LISTING_JSON, LAZADA_HEADLESS, LAZADA_BROWSER_CHANNEL)
+from database import DatabaseManager
+from lazada_scraper import (USER_AGENT, LOCALE, SCROLL_POLL_MS, NEXT_PAGE_NAV, NEXT_PAGE_BUTTON, CaptchaSkipped,
+                            add_page, count_page, is_last_page, launch_options, mouse_moves, parse_page,
+                            record_captcha, record_scroll, resource_policy, scroll_tracker, search_url)
+from lazy_load import NetworkTracker
+from metrics import get_metrics, timed
+from pacer import Pacer, get_pacer, max_rate_for, throttled
+
+
+class AsyncLazadaScraper:
+    def __init__(self, concurrency=LAZADA_CONCURRENCY, min_request_interval=None,
+                 pagination=LAZADA_PAGINATION, page_tabs=LAZADA_PAGE_TABS, headless=LAZADA_HEADLESS,
+                 channel=LAZADA_BROWSER_CHANNEL, save_to_db=True):
+        self.concurrency = concurrency
+        self.headless = headless
+        self.channel = channel
+        self.save_to_db = save_to_db
+        self.captcha_hits = 0
+        # keyword -> error of the searches that failed (and were not saved)
+        self.failed = {}
+        self.pagination = pagination
+        self.page_tabs = max(1, page_tabs)
+        self.wait_time = 25
+        self.user_agent = USER_AGENT
+        self.locale = LOCALE
+        self.db_name = LAZADA_DB_NAME
+        self.parser_backend = LAZADA_PARSER_BACKEND
+        self.use_listing_json = LAZADA_LISTING_JSON
+        self.resource_policy = resource_policy()
+        # None shares the process-wide pacer, capped at LAZADA_MIN_REQUEST_INTERVAL; 0 sets no ceiling
+        if min_request_interval is None:
+            self.pacer = get_pacer()
+        else:
+            self.pacer = Pacer(max_rate=max_rate_for(min_request_interval))
+        # replay.Recorder / replay.Replayer, set before scrape_many()
+        self.recorder = None
+        self.replayer = None
+
+    def _paced(self, url):
+        """Pacer slot for a request to url; replays are not held back"""
+        return self.pacer.request_async(url, wait=not self.replayer)
+
+    async def _goto(self, page, url):
+        async with self._paced(url) as ticket:
+            with get_metrics().span("page_load"):
+                response = await page.goto(url, timeout=60000)
+            if response is not None and throttled(response.status):
+                ticket.fail()
+
+    def _save(self, keyword, products):
+        if not self.save_to_db:
+            return
+        with get_metrics().span("db_write"):
+            DatabaseManager(self.db_name).insert_products(keyword, products)
+
+    async def _move_mouse_naturally(self, page, element):
+        for x, y, steps, pause in mouse_moves(await element.bounding_box()):
+            await page.mouse.move(x, y, steps=steps)
+            if not self.replayer:
+                await asyncio.sleep(pause)
+
+    async def _new_page(self, context):
+        page = await context.new_page()
+        network = NetworkTracker()
+        network.attach(page)
+        if self.recorder:
+            self.recorder.attach_async(page)
+        return page, network
+
+    @timed("scroll")
+    async def _scroll_until_loaded(self, page, network, keyword, page_number):
+        cards = page.locator(f"div.{CARD_CLASS}")
+        tracker = scroll_tracker()
+        tracker.begin(await cards.count())
+
+        done = False
+        while not done:
+            await page.mouse.wheel(0, random.randint(500, 1000))
+            await page.wait_for_timeout(SCROLL_POLL_MS)
+            while not tracker.scroll_settled(await cards.count(), network):
+                await page.wait_for_timeout(SCROLL_POLL_MS)
+            done = tracker.record_scroll(await cards.count())
+
+        return record_scroll(tracker)
+
+    async def _scrape_current_page(self, page, network, keyword, page_number):
+        print(f"[{keyword}] Loading more products... on page {page_number}")
+        await self._scroll_until_loaded(page, network, keyword, page_number)
+
+        html = await page.content()
+        # Parsing is CPU bound, keep it off the event loop
+        products, captcha = await asyncio.to_thread(parse_page, html, self.parser_backend)
+        if captcha:
+            # No one to solve it in a batch run: report it and end the search there
+            record_captcha(self, page.url)
+            raise CaptchaSkipped(f"CAPTCHA on page {page_number} not solved")
+        print(f"[{keyword}] Scraped {len(products)} products on page {page_number}.")
+        return products
+
+    async def _scrape_by_clicking(self, context, keyword, max_pages):
+        page, network = await self._new_page(context)
+        try:
+            await self._goto(page, search_url(keyword))
+
+            products = []
+            seen = set()
+            current_page = 1
+            while current_page <= max_pages:
+                try:
+                    page_products = await self._scrape_current_page(page, network, keyword, current_page)
+                except CaptchaSkipped as e:
+                    if not products:
+                        raise
+                    print(f"[{keyword}] {e}, stopping")
+                    break
+                if not page_products:
+                    print(f"[{keyword}] Page {current_page} is empty, stopping")
+                    break
+                add_page(products, page_products, seen)
+                if current_page == max_pages:
+                    break
+
+                nav = await page.wait_for_selector(NEXT_PAGE_NAV, timeout=3000)
+                next_page_btn = await nav.wait_for_selector(NEXT_PAGE_BUTTON, timeout=3000)
+                if is_last_page(await next_page_btn.get_attribute('class')):
+                    print(f"[{keyword}] No more pages available")
+                    break
+
+                await self._move_mouse_naturally(page, next_page_btn)
+                async with self._paced(page.url):
+                    with get_metrics().span("page_load"):
+                        await next_page_btn.click()
+                        await page.wait_for_load_state("domcontentloaded")
+                current_page += 1
+            return products
+        finally:
+            await page.close()
+
+    async def _request_text(self, context, url):
+        if self.replayer:
+            return await self.replayer.fetch_async(url)
+        response = await context.request.get(url, timeout=60000)
+        text = await response.text()
+        if self.recorder:
+            self.recorder.add(url, response.status, response.headers, text)
+        return response.status, text
+
+    async def _fetch_listing_json(self, context, keyword, page_number):
+        url = search_url(keyword, page_number, ajax=True)
+        try:
+            async with self._paced(url) as ticket:
+                with get_metrics().span("page_load"):
+                    status, text = await self._request_text(context, url)
+                if throttled(status):
+                    ticket.fail()
+            if not 200 <= status < 300:
+                return None
+            with get_metrics().span("parse"):
+                return parse_listing_json(text)
+        except Exception as e:
+            print(f"[{keyword}] Listing request failed: {e}")
+            return None
+
+    async def _fetch_page(self, context, keyword, page_number):
+        if self.use_listing_json:
+            products = await self._fetch_listing_json(context, keyword, page_number)
+            if products is not None:
+                print(f"[{keyword}] Scraped {len(products)} products on page {page_number} from listing data.")
+                count_page(products)
+                return products
+
+        page, network = await self._new_page(context)
+        try:
+            await self._goto(page, search_url(keyword, page_number))
+            # A full page load carries its own window.pageData, no scrolling needed
+            products = None
+            if self.use_listing_json:
+                html = await page.content()
+                with get_metrics().span("parse"):
+                    products = parse_listing_json(html)
+            if products is None:
+                products = await self._scrape_current_page(page, network, keyword, page_number)
+            count_page(products)
+            return products
+        finally:
+            await page.close()
+
+    async def _scrape_by_url(self, context, keyword, max_pages):
+        """Fetch result pages by URL in waves of page_tabs tabs, merged in page order"""
+        products = []
+        seen = set()
+        for first in range(1, max_pages + 1, self.page_tabs):
+            numbers = range(first, min(first + self.page_tabs, max_pages + 1))
+            # A failed tab ends the search there, keeping the pages before it
+            pages = await asyncio.gather(
+                *(self._fetch_page(context, keyword, number) for number in numbers),
+                return_exceptions=True
+            )
+            for number, page_products in zip(numbers, pages):
+                if isinstance(page_products, Exception):
+                    if not products:
+                        # Nothing to keep: fail the search rather than save an empty listing
+                        raise page_products
+                    print(f"[{keyword}] Page {number} failed: {page_products}, stopping")
+                    if not isinstance(page_products, CaptchaSkipped):
+                        get_metrics().inc("search_errors")
+                    return products
+                if not page_products:
+                    print(f"[{keyword}] Page {number} is empty, no more pages available")
+                    return products
+                products.extend(unique_products(page_products, seen))
+        return products
+
+    @timed("search")
+    async def search_and_scrape(self, context, keyword, max_pages):
+        """Async counterpart of LazadaScraper.search_and_scrape for one keyword"""
+        try:
+            print(f"Searching for '{keyword}'...")
+            if self.pagination == "url":
+                products = await self._scrape_by_url(context, keyword, max_pages)
+            else:
+                products = await self._scrape_by_clicking(context, keyword, max_pages)
+            print(f"\n[{keyword}] Total products scraped: {len(products)}")
+
+            # The database writer thread serializes saves from all tasks
+            await asyncio.to_thread(self._save, keyword, products)
+            return products
+
+        except Exception as e:
+            print(f"[{keyword}] Search and scrape failed: {str(e)}")
+            if not isinstance(e, CaptchaSkipped):
+                get_metrics().inc("search_errors")
+            self.failed[keyword] = str(e)
+            return []
+
+    async def _worker(self, contexts, keyword, max_pages):
+        context = await contexts.get()
+        try:
+            return await self.search_and_scrape(context, keyword, max_pages)
+        finally:
+            contexts.put_nowait(context)
+
+    async def scrape_many(self, keywords, max_pages=3):
+        """Scrape all keywords concurrently, returns {keyword: products}"""
+        async with async_playwright() as playwright:
+            browser = await playwright.chromium.launch(
+                **launch_options(self.user_agent, self.locale, self.headless, self.channel)
+            )
+            try:
+                contexts = asyncio.Queue()
+                for _ in range(min(self.concurrency, len(keywords)) or 1):
+                    context = await browser.new_context(user_agent=self.user_agent)
+                    if self.resource_policy:
+                        await self.resource_policy.install_async(context)
+                    if self.replayer:
+                        await self.replayer.install_async(context)
+                    contexts.put_nowait(context)
+
+                results = await asyncio.gather(
+                    *(self._worker(contexts, keyword, max_pages) for keyword in keywords)
+                )
+                if self.resource_policy:
+                    print(self.resource_policy.summary())
+                if self.pacer.buckets:
+                    print(self.pacer.summary())
+                return dict(zip(keywords, results))
+            finally:
+                await browser.close()
+                if self.recorder:
+                    self.recorder.save()
+                if self.replayer:
+                    print(self.replayer.summary())
+
+
+def scrape_keywords(keywords, max_pages=3, **options):
+    """Blocking entry point, returns {keyword: products}; options go to AsyncLazadaScraper"""
+    scraper = AsyncLazadaScraper(**options)
+    return asyncio.run(scraper.scrape_many(list(dict.fromkeys(keywords)), max_pages))
@@ -0,0 +1,131 @@
+"""Insert throughput and get_products latency on synthetic databases.
+
+Usage:
+    python benchmarks/bench_db.py [--rows 10000 100000 1000000] [--run-size N] [--repeat N]
+
+Each database is built from scratch in a temporary directory through
+DatabaseManager.insert_products, one scrape run per --run-size products
+(default RUN_SIZE) spread over KEYWORDS keywords, with links drawn from a catalog a tenth of
+the row count so later runs see existing products again. --changed is the
+share of those whose price and sold count moved since they were last seen;
+the default 1.0 makes every product write an observation. get_products is
+then timed for every sort option on the latest run of the first keyword,
+both for the first GUI chunk and for the whole run, with the query cache
+off. The run, not the database, is what get_products sorts: to see sort
+cost grow with size, raise --run-size (a run size of at least the row
+count makes each database a single run).
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import LAZADA_GUI_CHUNK_ROWS
+from database import DatabaseManager
+
+RUN_SIZE = 1000
+KEYWORDS = 10
+SORT_OPTIONS = ("default", "price_low_to_high", "price_high_to_low", "sold_high_to_low", "sold_low_to_high")
+
+
+def synthetic_runs(rows, run_size=RUN_SIZE, keywords=KEYWORDS, seed=0, changed=1.0):
+    """Yield (keyword, products) scrape runs adding up to rows scraped products"""
+    rng = random.Random(seed)
+    catalog = max(run_size, rows // 10)
+    for run in range(-(-rows // run_size)):
+        size = min(run_size, rows - run * run_size)
+        products = []
+        for link_id in rng.sample(range(catalog), size):
+            # Unchanged products repeat the values seeded by their link
+            values = rng if rng.random() < changed else random.Random(link_id)
+            sold = values.choice(["0 sold", f"{values.randint(1, 999)} sold",
+                                  f"{values.randint(1, 9)}.{values.randint(0, 9)}K sold"])
+            products.append({
+                'name': f"Synthetic product {link_id} with a long descriptive title",
+                'price': f"₱{values.randint(10, 99999):,}.00",
+                'sold': sold,
+                'link': f"//www.lazada.com.ph/products/item-{link_id}-i{1000000 + link_id}.html",
+            })
+        yield f"keyword {run % keywords}", products
+
+
+def build_database(path, rows, run_size=RUN_SIZE, changed=1.0):
+    """Ingest rows scraped products into path, returns (manager, ingest seconds)"""
+    db = DatabaseManager(path)
+    runs = list(synthetic_runs(rows, run_size, changed=changed))
+    start = time.perf_counter()
+    # insert_products reports every run, keep the benchmark output readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        for keyword, products in runs:
+            db.insert_products(keyword, products)
+    return db, time.perf_counter() - start
+
+
+def time_calls(func, repeat):
+    func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        'median_ms': statistics.median(samples) * 1000,
+        'p95_ms': samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000,
+    }
+
+
+def bench_get_products(db, repeat, keyword="keyword 0"):
+    db.manager.cache.maxsize = 0
+    results = []
+    for sort_option in SORT_OPTIONS:
+        for limit in (LAZADA_GUI_CHUNK_ROWS, None):
+            timing = time_calls(lambda: db.get_products(keyword, sort_option, limit=limit), repeat)
+            results.append(dict(timing, sort_option=sort_option, limit=limit,
+                                returned=len(db.get_products(keyword, sort_option, limit=limit))))
+    return results
+
+
+def run(rows_list, repeat, run_size=RUN_SIZE, changed=1.0):
+    """Benchmark records for every database size"""
+    records = []
+    for rows in rows_list:
+        with tempfile.TemporaryDirectory() as directory:
+            db, seconds = build_database(os.path.join(directory, "bench.db"), rows, run_size, changed)
+            records.append({
+                'benchmark': 'insert', 'rows': rows, 'run_size': run_size, 'changed': changed,
+                'seconds': seconds, 'rows_per_sec': rows / seconds,
+            })
+            for result in bench_get_products(db, repeat):
+                records.append(dict(result, benchmark='get_products', rows=rows, run_size=run_size))
+            db.manager.close()
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--run-size", type=int, default=RUN_SIZE, help="products per scrape run")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--changed", type=float, default=1.0, help="share of repeat products with new values")
+    args = parser.parse_args()
+
+    print(f"{'rows':>9} {'benchmark':<13} {'sort / limit':<28} {'median ms':>10} {'p95 ms':>9}")
+    for record in run(args.rows, args.repeat, args.run_size, args.changed):
+        if record['benchmark'] == 'insert':
+            print(f"{record['rows']:>9} {'insert':<13} {'':<28} {record['rows_per_sec']:>10,.0f} rows/sec")
+        else:
+            label = f"{record['sort_option']} / {record['limit'] or 'all'}"
+            print(f"{record['rows']:>9} {'get_products':<13} {label:<28} "
+                  f"{record['median_ms']:>10.3f} {record['p95_ms']:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Compare card-parser backends on saved search-result HTML.
+
+Usage:
+    python benchmarks/bench_parse.py [saved_page.html ...] [--repeat N]
+
+Pages can be saved with LAZADA_HTML_DUMP_DIR in config.py. Without any
+files a synthetic 40-card page shaped like Lazada's markup, with an
+embedded window.pageData listing, is used. The listing-json row is the
+embedded-JSON extractor; it shows 0 cards on pages without the payload.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from card_parser import available_backends, parse_cards, parse_listing_json
+
+
+def synthetic_search_page(n_cards=40, seed=0, page_data=True):
+    rng = random.Random(seed)
+    cards = []
+    items = []
+    for i in range(n_cards):
+        price = rng.randint(10, 99999)
+        sold = rng.choice(["", f"{rng.randint(1, 999)} sold", f"{rng.randint(1, 9)}.{rng.randint(0, 9)}K sold", "10K+ sold"])
+        items.append({
+            "name": f"Sample product number {i} with a long descriptive title",
+            "itemId": str(1000000 + i),
+            "itemUrl": f"//www.lazada.com.ph/products/item-{i}-i{1000000 + i}-s{2000000 + i}.html?search=1",
+            "price": f"{price}.00",
+            "priceShow": f"₱{price:,}.00",
+            "itemSoldCntShow": sold or None,
+            "location": "Metro Manila",
+        })
+        sold_html = f'<span class="_1cEkb"><span>{sold}</span><span>Reviews</span></span>' if sold else ""
+        cards.append(f"""
+<div class="Bm3ON" data-qa-locator="product-item" data-tracking="product-card">
+  <div class="Ms6aG">
+    <div class="ICdUp"><div class="_95X4G"><a href="//www.lazada.com.ph/products/item-{i}-i{1000000 + i}-s{2000000 + i}.html?search=1">
+      <div class="picture-wrapper"><img src="https://img.lazcdn.com/g/p/{i}.jpg_200x200q80.jpg" alt="item {i}"/></div></a></div></div>
+    <div class="qmXQo">
+      <div class="buTCk">
+        <div class="RfADt"><a href="//www.lazada.com.ph/products/item-{i}-i{1000000 + i}-s{2000000 + i}.html?search=1" title="Product {i}">Sample product number {i} with a long descriptive title</a></div>
+        <div class="aBrP0"><span class="ooOxS">₱{price:,}.00</span></div>
+        <div class="WNoq3">{sold_html}<span class="oa6ri" title="Philippines">Metro Manila</span></div>
+      </div>
+    </div>
+  </div>
+</div>""")
+    filler = "".join(f'<div class="nav-item"><a href="/c/{i}">Category {i}</a></div>' for i in range(300))
+    script = f'var x = {{"filler": "{"x" * 20000}"}};'
+    if page_data:
+        script += f'window.pageData = {json.dumps({"mods": {"listItems": items}}, ensure_ascii=False)};'
+    return (f'<!DOCTYPE html><html><head><title>Search</title>'
+            f'<script>{script}</script></head><body>'
+            f'<div class="header">{filler}</div><div class="_17mcb">{"".join(cards)}</div></body></html>')
+
+
+def bench(html, backend, repeat):
+    parse = parse_listing_json if backend == "listing-json" else lambda page: parse_cards(page, backend)
+    parse(html)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        products = parse(html) or []
+    elapsed = (time.perf_counter() - start) / repeat
+    return elapsed, len(products)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("files", nargs="*", help="saved search-result pages")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    pages = []
+    for path in args.files:
+        with open(path, encoding="utf-8") as f:
+            pages.append((os.path.basename(path), f.read()))
+    if not pages:
+        pages.append(("synthetic-40", synthetic_search_page()))
+
+    backends = available_backends() + ["listing-json"]
+    print(f"{'page':<30} {'backend':<12} {'ms/page':>10} {'cards':>6}")
+    for label, html in pages:
+        for backend in backends:
+            elapsed, count = bench(html, backend, args.repeat)
+            print(f"{label:<30} {backend:<12} {elapsed * 1000:>10.2f} {count:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""GUI startup time: importing lazada.py and getting the window painted.
+
+Usage:
+    python benchmarks/bench_startup.py [--repeat N] [--db saved.db]
+
+Every sample is a fresh interpreter started in a temporary directory, so
+nothing is cached in sys.modules and the GUI opens an empty database (or a
+copy of --db). import_ms is the time to import lazada; first_paint_ms runs
+from the start of that import until the main window has been drawn once.
+The scraping modules the import pulled in are reported as well, since
+they should only load when a scrape starts. First paint needs a display
+and is skipped without one.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from config import LAZADA_DB_NAME
+
+# Modules the GUI should not need until a scrape starts
+HEAVY_MODULES = ("playwright", "bs4", "lxml", "selectolax", "lazada_scraper", "scraper_service")
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import lazada
+result = {'import_ms': (time.perf_counter() - start) * 1000,
+          'heavy_modules': [name for name in %r if name in sys.modules]}
+try:
+    root = lazada.tk.Tk()
+except lazada.tk.TclError:
+    result['first_paint_ms'] = None
+else:
+    gui = lazada.LazadaGUI(root)
+    root.wait_visibility()
+    root.update()
+    result['first_paint_ms'] = (time.perf_counter() - start) * 1000
+    root.destroy()
+print(json.dumps(result))
+""" % (HEAVY_MODULES,)
+
+
+def sample(db=None):
+    """One cold start, as a dict of import_ms, first_paint_ms and heavy_modules"""
+    with tempfile.TemporaryDirectory() as directory:
+        if db:
+            shutil.copy(db, os.path.join(directory, LAZADA_DB_NAME))
+        env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+        output = subprocess.run([sys.executable, "-c", CHILD], cwd=directory, env=env,
+                                capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def run(repeat, db=None):
+    """Benchmark records for the import and first paint phases"""
+    samples = [sample(db) for _ in range(repeat)]
+    records = []
+    for phase in ("import_ms", "first_paint_ms"):
+        values = sorted(s[phase] for s in samples if s[phase] is not None)
+        if not values:
+            continue
+        records.append({
+            'benchmark': 'startup', 'phase': phase[:-3], 'samples': len(values),
+            'median_ms': statistics.median(values),
+            'p95_ms': values[min(len(values) - 1, int(len(values) * 0.95))],
+            'heavy_modules': samples[0]['heavy_modules'],
+        })
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--db", help="database to open in the GUI (copied first), default an empty one")
+    args = parser.parse_args()
+
+    records = run(args.repeat, args.db)
+    for record in records:
+        print(f"{record['phase']:<12} median {record['median_ms']:8.1f} ms   p95 {record['p95_ms']:8.1f} ms")
+    if len(records) < 2:
+        print("first_paint  skipped, no display")
+    if records and records[0]['heavy_modules']:
+        print(f"Loaded at startup: {', '.join(records[0]['heavy_modules'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Run the offline benchmark suite and write the results as JSON.
+
+Usage:
+    python benchmarks/run_benchmarks.py [-o results.json] [--rows 10000 100000 1000000] [--run-size N]
+                                        [--pages saved_page.html ...] [--startup-repeat N]
+                                        [--compare baseline.json]
+
+No network is needed: parsing runs on saved search pages (or the synthetic
+page from bench_parse.py), the database benchmarks on synthetic
+databases built in a temporary directory and the GUI startup benchmark in
+fresh interpreters. The output records the commit,
+Python and SQLite versions with every result, so runs from different
+commits can be diffed; --compare prints the change against an earlier file.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+
+import bench_db
+import bench_parse
+import bench_startup
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_ROWS = [10000, 100000, 1000000]
+
+
+def git_commit():
+    """HEAD's hash, suffixed with -dirty when the tree has local changes"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{commit}-dirty" if dirty else commit
+
+
+def parse_records(paths, repeat):
+    pages = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            pages.append((os.path.basename(path), f.read()))
+    if not pages:
+        pages.append(("synthetic-40", bench_parse.synthetic_search_page()))
+
+    records = []
+    for label, html in pages:
+        for backend in bench_parse.available_backends() + ["listing-json"]:
+            elapsed, cards = bench_parse.bench(html, backend, repeat)
+            records.append({
+                'benchmark': 'parse', 'page': label, 'backend': backend, 'cards': cards,
+                'ms_per_page': elapsed * 1000,
+                'cards_per_sec': cards / elapsed if elapsed > 0 and cards else 0,
+            })
+    return records
+
+
+def record_key(record):
+    return tuple(record.get(field) for field in ('benchmark', 'page', 'backend', 'rows', 'run_size',
+                                                 'sort_option', 'limit', 'phase'))
+
+
+def headline(record):
+    """The value compared across runs and whether higher is better"""
+    if record['benchmark'] == 'parse':
+        return record['ms_per_page'], False
+    if record['benchmark'] == 'insert':
+        return record['rows_per_sec'], True
+    return record['median_ms'], False
+
+
+def compare(results, baseline, out=sys.stdout):
+    previous = {record_key(record): record for record in baseline['results']}
+    print(f"Compared with {baseline.get('commit') or 'unknown commit'}:", file=out)
+    for record in results['results']:
+        old = previous.get(record_key(record))
+        if old is None:
+            continue
+        (new_value, higher_is_better), (old_value, _) = headline(record), headline(old)
+        if not old_value:
+            continue
+        change = (new_value - old_value) / old_value * 100
+        better = change > 0 if higher_is_better else change < 0
+        label = " ".join(str(part) for part in record_key(record) if part is not None)
+        print(f"  {label:<60} {old_value:>12.3f} -> {new_value:>12.3f} "
+              f"({change:+.1f}%{'' if abs(change) < 5 else ', better' if better else ', worse'})", file=out)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-o", "--output", help="write the JSON here instead of stdout")
+    parser.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS, help="synthetic database sizes")
+    parser.add_argument("--run-size", type=int, default=bench_db.RUN_SIZE,
+                        help="products per synthetic scrape run, i.e. rows sorted by get_products")
+    parser.add_argument("--pages", nargs="*", default=[], help="saved search-result pages to parse")
+    parser.add_argument("--parse-repeat", type=int, default=20)
+    parser.add_argument("--query-repeat", type=int, default=20)
+    parser.add_argument("--startup-repeat", type=int, default=10, help="cold GUI starts, 0 to skip")
+    parser.add_argument("--compare", metavar="BASELINE", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    results = {
+        'commit': git_commit(),
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'results': (parse_records(args.pages, args.parse_repeat) + bench_db.run(args.rows, args.query_repeat, args.run_size)
+                    + (bench_startup.run(args.startup_repeat) if args.startup_repeat else [])),
+    }
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + "\n")
+        print(f"Wrote {len(results['results'])} results to {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        # Keep stdout pure JSON when the results go there
+        compare(results, baseline, sys.stdout if args.output else sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+"""Extraction of product cards from rendered Lazada search-result pages.
+
+parse_cards() parses the page once with the fastest available backend and
+returns the same product dicts the scraper stores in the database.
+parse_listing_json() reads the listing data Lazada embeds in the page
+(window.pageData) or returns from the ajax=true endpoint, which needs no
+scrolling; parse_products() tries it first and falls back to the DOM.
+"""
+import json
+import re
+from metrics import get_metrics
+
+CARD_CLASS = "Bm3ON"
+NAME_SELECTOR = "div.Ms6aG div.qmXQo div.buTCk a"
+PRICE_SELECTOR = "span.ooOxS"
+SOLD_SELECTOR = "span._1cEkb > span"
+
+BACKENDS = ("lxml", "selectolax", "bs4")
+
+_PAGE_DATA = re.compile(r"window\.pageData\s*=\s*")
+# Product links end in -i<item id>-s<sku id>.html, the SKU part is optional
+_PRODUCT_IDS = re.compile(r"-i(\d+)(?:-s(\d+))?\.html")
+
+
+def _xpath_class(name):
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+
+
+def _product(name, price, sold, link):
+    return {
+        'name': name,
+        'price': price,
+        'sold': sold,
+        'link': link
+    }
+
+
+def _parse_lxml(html):
+    from lxml import etree, html as lxml_html
+
+    if not hasattr(_parse_lxml, "xpaths"):
+        # Compiled once per process and reused for every page
+        _parse_lxml.xpaths = (
+            etree.XPath(f"//div[{_xpath_class(CARD_CLASS)}]"),
+            etree.XPath(f".//div[{_xpath_class('Ms6aG')}]//div[{_xpath_class('qmXQo')}]"
+                        f"//div[{_xpath_class('buTCk')}]//a"),
+            etree.XPath(f".//span[{_xpath_class('ooOxS')}]"),
+            etree.XPath(f".//span[{_xpath_class('_1cEkb')}]/span"),
+        )
+    cards_xp, name_xp, price_xp, sold_xp = _parse_lxml.xpaths
+
+    def text(element):
+        return "".join(s.strip() for s in element.itertext())
+
+    products = []
+    for card in cards_xp(lxml_html.document_fromstring(html)):
+        try:
+            name_tags = name_xp(card)
+            if name_tags:
+                name = text(name_tags[0])
+                link = name_tags[0].attrib['href'].split('?')[0]
+            else:
+                raise ValueError("card has no product link")
+
+            price = text(price_xp(card)[0])
+
+            sold_spans = sold_xp(card)
+            sold = text(sold_spans[0]) if sold_spans else "0 sold"
+
+            products.append(_product(name, price, sold, link))
+        except Exception as e:
+            print(f"Error scraping product: {e}")
+            get_metrics().inc("parse_errors")
+            continue
+    return products
+
+
+def _selectolax_parser():
+    try:
+        from selectolax.lexbor import LexborHTMLParser
+        return LexborHTMLParser
+    except ImportError:
+        # selectolax < 1.0 without the lexbor build
+        from selectolax.parser import HTMLParser
+        return HTMLParser
+
+
+def _parse_selectolax(html):
+    products = []
+    for card in _selectolax_parser()(html).css(f"div.{CARD_CLASS}"):
+        try:
+            name_tag = card.css_first(NAME_SELECTOR)
+            if name_tag:
+                name = name_tag.text(separator="", strip=True)
+                link = name_tag.attributes['href'].split('?')[0]
+            else:
+                raise ValueError("card has no product link")
+
+            price = card.css_first(PRICE_SELECTOR).text(separator="", strip=True)
+
+            sold_span = card.css_first(SOLD_SELECTOR)
+            sold = sold_span.text(separator="", strip=True) if sold_span else "0 sold"
+
+            products.append(_product(name, price, sold, link))
+        except Exception as e:
+            print(f"Error scraping product: {e}")
+            get_metrics().inc("parse_errors")
+            continue
+    return products
+
+
+def _parse_bs4(html):
+    from bs4 import BeautifulSoup
+
+    products = []
+    soup = BeautifulSoup(html, 'html.parser')
+    for card in soup.select(f"div.{CARD_CLASS}"):
+        try:
+            name_tag = card.select_one(NAME_SELECTOR)
+            if name_tag:
+                name = name_tag.get_text(strip=True)
+                link = name_tag['href'].split('?')[0]
+            else:
+                raise ValueError("card has no product link")
+
+            price = card.select_one(PRICE_SELECTOR).get_text(strip=True)
+
+            sold_span = card.select_one(SOLD_SELECTOR)
+            sold = sold_span.get_text(strip=True) if sold_span else "0 sold"
+
+            products.append(_product(name, price, sold, link))
+        except Exception as e:
+            print(f"Error scraping product: {e}")
+            get_metrics().inc("parse_errors")
+            continue
+    return products
+
+
+_PARSERS = {
+    "lxml": _parse_lxml,
+    "selectolax": _parse_selectolax,
+    "bs4": _parse_bs4,
+}
+
+
+def available_backends():
+    available = []
+    for backend, modules in (("lxml", ("lxml.html",)),
+                             ("selectolax", ("selectolax.lexbor", "selectolax.parser")),
+                             ("bs4", ("bs4",))):
+        for module in modules:
+            try:
+                __import__(module)
+            except ImportError:
+                continue
+            available.append(backend)
+            break
+    return available
+
+
+def default_backend():
+    available = available_backends()
+    if not available:
+        raise ImportError("No HTML parser available; install lxml or bs4")
+    return available[0]
+
+
+def parse_cards(html, backend=None):
+    """Return the product dicts for every card on a search-result page"""
+    if backend is None:
+        if not hasattr(parse_cards, "backend"):
+            parse_cards.backend = default_backend()
+        backend = parse_cards.backend
+    elif backend not in _PARSERS:
+        raise ValueError(f"Unknown parser backend: {backend}")
+    return _PARSERS[backend](html)
+
+
+def _listing_product(item):
+    price = item.get('priceShow')
+    if not price and item.get('price') is not None:
+        # Formatted as the cards show it, so both paths store the same text
+        price = f"₱{float(item['price']):,.2f}"
+    link = item.get('itemUrl') or item.get('productUrl')
+    if not link:
+        raise ValueError("listing item has no product link")
+    return _product(
+        item.get('name') or "No name found",
+        price or "",
+        item.get('itemSoldCntShow') or "0 sold",
+        link.split('?')[0]
+    )
+
+
+def extract_page_data(text):
+    """The listing JSON as a dict, from an ajax response body or a page's window.pageData"""
+    stripped = text.lstrip()
+    if stripped.startswith('{'):
+        try:
+            return json.loads(stripped)
+        except ValueError:
+            return None
+
+    match = _PAGE_DATA.search(text)
+    if not match:
+        return None
+    try:
+        data, _ = json.JSONDecoder().raw_decode(text, match.end())
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def parse_listing_json(text):
+    """Product dicts from the embedded listing payload, None when the payload is missing"""
+    data = extract_page_data(text)
+    if data is None:
+        return None
+    items = (data.get('mods') or {}).get('listItems')
+    if items is None:
+        return None
+
+    products = []
+    for item in items:
+        try:
+            products.append(_listing_product(item))
+        except Exception as e:
+            print(f"Error scraping product: {e}")
+            get_metrics().inc("parse_errors")
+            continue
+    return products
+
+
+def product_ids(link):
+    """(item_id, sku_id) as ints parsed from a product link, None for any part that is missing"""
+    match = _PRODUCT_IDS.search(link or "")
+    if not match:
+        return None, None
+    return int(match.group(1)), int(match.group(2)) if match.group(2) else None
+
+
+def unique_products(products, seen):
+    """The products whose item (or link, without an item id) is not in seen yet, adding them to it.
+
+    Pass the same set for every page of a search: sponsored cards repeat
+    from page to page.
+    """
+    unique = []
+    for product in products:
+        key = product_ids(product['link'])[0] or product['link']
+        if key not in seen:
+            seen.add(key)
+            unique.append(product)
+    return unique
+
+
+def parse_products(html, backend=None):
+    """Products from the embedded listing payload if present, otherwise from the card markup"""
+    products = parse_listing_json(html)
+    if products is None:
+        products = parse_cards(html, backend)
+    return products
@@ -4,4 +4,62 @@ SHOPEE_DB_NAME = "shopee_products.db"
 
 # Lazada configuration
 LAZADA_COOKIE_FILE = "lazada_cookies.json"
-LAZADA_DB_NAME = "lazada_products.db"
\ No newline at end of file
+LAZADA_DB_NAME = "lazada_products.db"
+# Card parser backend: "lxml", "selectolax", "bs4" or None to pick the fastest installed
+LAZADA_PARSER_BACKEND = None
+# Directory to save each rendered search page to (e.g. for benchmarks), None to disable
+LAZADA_HTML_DUMP_DIR = None
+# Concurrent scraping (async_scraper.py): browser contexts in the pool and
+# minimum seconds between requests to the same host (the pacer's ceiling)
+LAZADA_CONCURRENCY = 4
+LAZADA_MIN_REQUEST_INTERVAL = 1.0
+# Request pacing (pacer.py): requests/sec per host to start at and never go
+# below, requests allowed in a burst, response seconds counted as slow, and
+# the first and longest pause after a CAPTCHA or error
+LAZADA_PACER_RATE = 0.5
+LAZADA_PACER_MIN_RATE = 0.05
+LAZADA_PACER_BURST = 2
+LAZADA_PACER_SLOW_RESPONSE = 5.0
+LAZADA_PACER_BACKOFF = 5.0
+LAZADA_PACER_MAX_BACKOFF = 300.0
+# "click" follows the next-page button, "url" opens result pages by URL in
+# LAZADA_PAGE_TABS tabs at once
+LAZADA_PAGINATION = "url"
+LAZADA_PAGE_TABS = 3
+# Sharded scraping (sharded_scraper.py): worker processes, each with its own
+# browser (None uses every core), and times a failed keyword is retried
+LAZADA_PROCESSES = None
+LAZADA_SHARD_RETRIES = 2
+# Read products from Lazada's embedded listing JSON (no scrolling) and fall
+# back to the page markup when it is missing
+LAZADA_LISTING_JSON = True
+# Abort requests the scraper never reads (see resource_policy.py); URLs
+# containing an allowlist entry always load
+LAZADA_BLOCK_RESOURCES = True
+LAZADA_BLOCKED_RESOURCE_TYPES = ("image", "media", "font")
+LAZADA_RESOURCE_ALLOWLIST = ("captcha", "punish", "nocaptcha")
+# Warm scraper service used by the GUI: replace the browser context after
+# this many jobs or once the page's JS heap exceeds this many MB
+LAZADA_SERVICE_MAX_JOBS_PER_CONTEXT = 20
+LAZADA_SERVICE_MAX_HEAP_MB = 512
+# Adaptive scrolling: stop after this many scrolls without new cards, with
+# listing requests idle for LAZADA_SCROLL_IDLE seconds, or when the
+# scroll/time budget per page runs out
+LAZADA_SCROLL_STABLE_ROUNDS = 2
+LAZADA_SCROLL_IDLE = 0.5
+LAZADA_SCROLL_MAX = 15
+LAZADA_SCROLL_BUDGET = 20
+# Browser used by the scrapers; channel None uses Playwright's bundled Chromium
+LAZADA_HEADLESS = False
+LAZADA_BROWSER_CHANNEL = "msedge"
+# Rows the GUI loads into the results table at a time while scrolling, and
+# chunks kept on each side of the visible one (farther rows are dropped)
+LAZADA_GUI_CHUNK_ROWS = 200
+LAZADA_GUI_WINDOW_CHUNKS = 2
+# Price drops (percent since the previous observation) counted in the GUI's stats header
+LAZADA_PRICE_DROP_PERCENT = 10
+# Per-phase timings and counters (see metrics.py), written after each run
+# as a JSON summary and a Prometheus textfile; either path may be None
+LAZADA_METRICS = False
+LAZADA_METRICS_JSON = "metrics/lazada_run.json"
+LAZADA_METRICS_PROM = "metrics/lazada_scrape.prom"
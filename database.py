@@ -1,130 +1,1030 @@
+import atexit
+import bisect
+import contextlib
+import json
+import os
+import pathlib
+import queue
+import re
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from card_parser import product_ids
 
-class DatabaseManager:
-    def __init__(self, db_name):
+_NUMBER = re.compile(r"\d[\d,]*(?:\.\d+)?")
+_SOLD = re.compile(r"(\d[\d,]*(?:\.\d+)?)\s*([KkMm])?")
+_SOLD_MULTIPLIERS = {'k': 1000, 'm': 1000000}
+
+SCHEMA_VERSION = 8
+
+# Idle read-only connections kept per database, and writes committed together
+READ_POOL_SIZE = 4
+WRITE_BATCH_SIZE = 64
+# Query results kept in memory per database
+QUERY_CACHE_SIZE = 256
+
+# Upper bounds (centavos) of the price_stats histogram buckets, ₱50 to ₱50,000;
+# the last bucket holds everything above
+PRICE_HISTOGRAM_EDGES = (5000, 10000, 20000, 50000, 100000, 200000, 500000, 1000000, 2000000, 5000000)
+
+# Row layout of DatabaseManager.iter_products
+EXPORT_COLUMNS = ('keyword', 'name', 'price', 'sold', 'price_centavos', 'sold_count',
+                  'link', 'item_id', 'sku_id', 'position', 'last_seen_at')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS keywords (
+    id INTEGER PRIMARY KEY,
+    keyword TEXT NOT NULL UNIQUE,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    data_version INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS scrape_runs (
+    id INTEGER PRIMARY KEY,
+    keyword_id INTEGER NOT NULL REFERENCES keywords(id),
+    started_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    product_count INTEGER NOT NULL DEFAULT 0,
+    -- NULL for runs recorded before change tracking
+    new_count INTEGER,
+    changed_count INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_scrape_runs_keyword ON scrape_runs (keyword_id, id);
+
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    link TEXT NOT NULL UNIQUE,
+    name TEXT NOT NULL,
+    first_seen DATETIME DEFAULT CURRENT_TIMESTAMP,
+    item_id INTEGER,
+    sku_id INTEGER
+);
+-- One row per Lazada item, whatever link or keyword it was found under
+CREATE UNIQUE INDEX IF NOT EXISTS idx_products_item ON products (item_id);
+
+CREATE TABLE IF NOT EXISTS observations (
+    id INTEGER PRIMARY KEY,
+    product_id INTEGER NOT NULL REFERENCES products(id),
+    scrape_run_id INTEGER NOT NULL REFERENCES scrape_runs(id),
+    position INTEGER NOT NULL,
+    price TEXT NOT NULL,
+    sold TEXT NOT NULL,
+    price_centavos INTEGER,
+    sold_count INTEGER,
+    ts DATETIME DEFAULT CURRENT_TIMESTAMP
+);
+-- Covers "latest price per product" and "price series for a product"
+CREATE INDEX IF NOT EXISTS idx_observations_product
+    ON observations (product_id, scrape_run_id, price_centavos, sold_count, ts);
+
+-- What each keyword's results currently look like. Rows seen in the
+-- keyword's latest run make up its listing; observations are only written
+-- for rows that are new or whose price or sold count changed.
+CREATE TABLE IF NOT EXISTS keyword_products (
+    keyword_id INTEGER NOT NULL REFERENCES keywords(id),
+    product_id INTEGER NOT NULL REFERENCES products(id),
+    position INTEGER NOT NULL,
+    price TEXT NOT NULL,
+    sold TEXT NOT NULL,
+    price_centavos INTEGER,
+    sold_count INTEGER,
+    first_seen_run INTEGER NOT NULL,
+    last_seen_run INTEGER NOT NULL,
+    last_changed_run INTEGER NOT NULL,
+    last_seen_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    -- Price at the observation before the latest one
+    previous_price_centavos INTEGER,
+    PRIMARY KEY (keyword_id, product_id)
+) WITHOUT ROWID;
+
+-- Price summary of every scrape run, written with the run
+CREATE TABLE IF NOT EXISTS price_stats (
+    scrape_run_id INTEGER PRIMARY KEY REFERENCES scrape_runs(id),
+    keyword_id INTEGER NOT NULL REFERENCES keywords(id),
+    product_count INTEGER NOT NULL,
+    priced_count INTEGER NOT NULL,
+    min_centavos INTEGER,
+    max_centavos INTEGER,
+    mean_centavos INTEGER,
+    p25_centavos INTEGER,
+    median_centavos INTEGER,
+    p75_centavos INTEGER,
+    p90_centavos INTEGER,
+    -- JSON list of counts per PRICE_HISTOGRAM_EDGES bucket
+    histogram TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_price_stats_keyword ON price_stats (keyword_id, scrape_run_id);
+
+-- Products whose price fell since their previous observation, per run
+CREATE TABLE IF NOT EXISTS price_drops (
+    scrape_run_id INTEGER NOT NULL REFERENCES scrape_runs(id),
+    product_id INTEGER NOT NULL REFERENCES products(id),
+    old_centavos INTEGER NOT NULL,
+    new_centavos INTEGER NOT NULL,
+    PRIMARY KEY (scrape_run_id, product_id)
+) WITHOUT ROWID;
+"""
+
+# A product is shared by every keyword that found it: renaming it changes
+# the data (and so the cached views) of all of them
+VERSION_SCHEMA = """
+CREATE TRIGGER IF NOT EXISTS products_rename_version AFTER UPDATE OF name ON products BEGIN
+    UPDATE keywords SET data_version = data_version + 1
+    WHERE id IN (SELECT keyword_id FROM keyword_products WHERE product_id = new.id);
+END;
+"""
+
+# Full-text index over product names of every keyword, kept in sync by triggers
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5(
+    name, content='products', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS product_search_insert AFTER INSERT ON products BEGIN
+    INSERT INTO product_search (rowid, name) VALUES (new.id, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS product_search_delete AFTER DELETE ON products BEGIN
+    INSERT INTO product_search (product_search, rowid, name) VALUES ('delete', old.id, old.name);
+END;
+CREATE TRIGGER IF NOT EXISTS product_search_update AFTER UPDATE OF name ON products BEGIN
+    INSERT INTO product_search (product_search, rowid, name) VALUES ('delete', old.id, old.name);
+    INSERT INTO product_search (rowid, name) VALUES (new.id, new.name);
+END;
+"""
+
+# (index suffix, indexed columns) for every ORDER BY used by get_products
+_SORT_INDEXES = (
+    ('position', 'position ASC'),
+    ('price_asc', 'price_centavos ASC, sold_count DESC'),
+    ('price_desc', 'price_centavos ASC, sold_count ASC'),
+    ('sold_desc', 'sold_count DESC, price_centavos ASC'),
+    ('sold_asc', 'sold_count ASC, price_centavos ASC'),
+)
+
+_SORT_ORDERS = {
+    'price_low_to_high': "kp.price_centavos ASC, kp.sold_count DESC",
+    'price_high_to_low': "kp.price_centavos DESC, kp.sold_count DESC",
+    'sold_high_to_low': "kp.sold_count DESC, kp.price_centavos ASC",
+    'sold_low_to_high': "kp.sold_count ASC, kp.price_centavos ASC",
+    'default': "kp.position ASC",
+}
+
+
+def parse_price_centavos(price):
+    """'₱1,234.50' -> 123450, None when the text has no number"""
+    match = _NUMBER.search(price or '')
+    if not match:
+        return None
+    return int(round(float(match.group(0).replace(',', '')) * 100))
+
+
+def parse_sold_count(sold):
+    """'1.2K sold' -> 1200, '10K+ sold' -> 10000, '35 sold/month' -> 35"""
+    match = _SOLD.search(sold or '')
+    if not match:
+        return 0
+    count = float(match.group(1).replace(',', ''))
+    if match.group(2):
+        count *= _SOLD_MULTIPLIERS[match.group(2).lower()]
+    return int(round(count))
+
+
+# products.id for an (item_id, link) parameter pair, by item when the link has one
+_PRODUCT_ID = """COALESCE((SELECT id FROM products WHERE item_id = ?),
+                          (SELECT id FROM products WHERE link = ?))"""
+
+
+def _keyword_id(cur, keyword, create=False):
+    if create:
+        cur.execute("INSERT OR IGNORE INTO keywords (keyword) VALUES (?)", (keyword,))
+    cur.execute("SELECT id FROM keywords WHERE keyword = ?", (keyword,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def _start_scrape_run(cur, keyword, started_at=None):
+    keyword_id = _keyword_id(cur, keyword, create=True)
+    cur.execute("UPDATE keywords SET data_version = data_version + 1 WHERE id = ?", (keyword_id,))
+    cur.execute(
+        "INSERT INTO scrape_runs (keyword_id, started_at) VALUES (?, COALESCE(?, CURRENT_TIMESTAMP))",
+        (keyword_id, started_at)
+    )
+    return cur.lastrowid
+
+
+def _record_products(cur, run_id, products, ts=None):
+    """Store one run's products, returns (stored, new, changed) counts.
+
+    Every product's keyword_products row is touched; observations are only
+    added for products that are new to the keyword or whose price or sold
+    text differs from the last run. Only the first product of an item (or
+    link) counts in a run, so stored can be below len(products).
+    """
+    cur.execute("SELECT keyword_id FROM scrape_runs WHERE id = ?", (run_id,))
+    keyword_id = cur.fetchone()[0]
+    keyed = []
+    seen = set()
+    for position, product in enumerate(products):
+        item_id, sku_id = product_ids(product['link'])
+        key = product['link'] if item_id is None else item_id
+        if key not in seen:
+            seen.add(key)
+            keyed.append((position, product, item_id, sku_id))
+    cur.executemany(
+        """INSERT INTO products (item_id, sku_id, link, name) VALUES (?, ?, ?, ?)
+           ON CONFLICT(item_id) DO UPDATE SET name = excluded.name WHERE name <> excluded.name""",
+        ((item_id, sku_id, product['link'], product['name'])
+         for _, product, item_id, sku_id in keyed if item_id is not None)
+    )
+    cur.executemany(
+        """INSERT INTO products (link, name) VALUES (?, ?)
+           ON CONFLICT(link) DO UPDATE SET name = excluded.name WHERE name <> excluded.name""",
+        ((product['link'], product['name']) for _, product, item_id, _ in keyed if item_id is None)
+    )
+    # "WHERE true" keeps SQLite from reading ON CONFLICT as part of the SELECT
+    cur.executemany(
+        """INSERT INTO keyword_products
+               (keyword_id, product_id, position, price, sold, price_centavos, sold_count,
+                first_seen_run, last_seen_run, last_changed_run, last_seen_at)
+            SELECT ?1, COALESCE((SELECT id FROM products WHERE item_id = ?2),
+                                (SELECT id FROM products WHERE link = ?3)),
+                   ?4, ?5, ?6, ?7, ?8, ?9, ?9, ?9, COALESCE(?10, CURRENT_TIMESTAMP) WHERE true
+            ON CONFLICT(keyword_id, product_id) DO UPDATE SET
+                position = excluded.position,
+                last_changed_run = CASE WHEN price IS NOT excluded.price OR sold IS NOT excluded.sold
+                                        THEN excluded.last_changed_run ELSE last_changed_run END,
+                previous_price_centavos = CASE WHEN price IS NOT excluded.price OR sold IS NOT excluded.sold
+                                               THEN price_centavos ELSE previous_price_centavos END,
+                price = excluded.price,
+                sold = excluded.sold,
+                price_centavos = excluded.price_centavos,
+                sold_count = excluded.sold_count,
+                last_seen_run = excluded.last_seen_run,
+                last_seen_at = excluded.last_seen_at""",
+        ((keyword_id, item_id, product['link'], position, product['price'], product['sold'],
+          parse_price_centavos(product['price']), parse_sold_count(product['sold']), run_id, ts)
+         for position, product, item_id, _ in keyed)
+    )
+    cur.execute(
+        """INSERT INTO observations
+               (product_id, scrape_run_id, position, price, sold, price_centavos, sold_count, ts)
+           SELECT product_id, last_changed_run, position, price, sold, price_centavos, sold_count, last_seen_at
+           FROM keyword_products
+           WHERE keyword_id = ? AND last_changed_run = ?""",
+        (keyword_id, run_id)
+    )
+    cur.execute(
+        """SELECT COALESCE(SUM(first_seen_run = ?2), 0), COALESCE(SUM(first_seen_run <> ?2), 0)
+           FROM keyword_products WHERE keyword_id = ?1 AND last_changed_run = ?2""",
+        (keyword_id, run_id)
+    )
+    new, changed = cur.fetchone()
+    cur.execute("SELECT COUNT(*) FROM keyword_products WHERE keyword_id = ? AND last_seen_run = ?",
+                (keyword_id, run_id))
+    stored = cur.fetchone()[0]
+    cur.execute(
+        "UPDATE scrape_runs SET product_count = ?, new_count = ?, changed_count = ? WHERE id = ?",
+        (stored, new, changed, run_id)
+    )
+    cur.execute(
+        """INSERT INTO price_drops (scrape_run_id, product_id, old_centavos, new_centavos)
+           SELECT last_changed_run, product_id, previous_price_centavos, price_centavos
+           FROM keyword_products
+           WHERE keyword_id = ? AND last_changed_run = ? AND price_centavos < previous_price_centavos""",
+        (keyword_id, run_id)
+    )
+    _record_price_stats(cur, keyword_id, run_id)
+    return stored, new, changed
+
+
+def _percentile(values, fraction):
+    """Linearly interpolated percentile of sorted values"""
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return int(round(values[lower] + (values[upper] - values[lower]) * (position - lower)))
+
+
+def _record_price_stats(cur, keyword_id, run_id):
+    """Summarize the prices of the products run_id saw, read in order from the price index"""
+    cur.execute(
+        """SELECT price_centavos FROM keyword_products
+           WHERE keyword_id = ? AND last_seen_run = ?
+           ORDER BY price_centavos ASC, sold_count DESC""",
+        (keyword_id, run_id)
+    )
+    rows = cur.fetchall()
+    prices = [price for (price,) in rows if price is not None]
+    histogram = [0] * (len(PRICE_HISTOGRAM_EDGES) + 1)
+    for price in prices:
+        histogram[bisect.bisect_left(PRICE_HISTOGRAM_EDGES, price)] += 1
+    summary = (prices[0], prices[-1], int(round(sum(prices) / len(prices))),
+               *(_percentile(prices, fraction) for fraction in (0.25, 0.5, 0.75, 0.9))) if prices else (None,) * 7
+    cur.execute(
+        """INSERT OR REPLACE INTO price_stats
+               (scrape_run_id, keyword_id, product_count, priced_count, min_centavos, max_centavos,
+                mean_centavos, p25_centavos, median_centavos, p75_centavos, p90_centavos, histogram)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        (run_id, keyword_id, len(rows), len(prices), *summary, json.dumps(histogram))
+    )
+
+
+def _import_legacy_table(cur, table_name):
+    keyword = table_name.replace('products_', '', 1).replace('_', ' ')
+    print(f"Importing {table_name} as '{keyword}'")
+
+    cur.execute(f"SELECT name, price, sold, link, timestamp FROM {table_name} ORDER BY id")
+    rows = cur.fetchall()
+    started_at = min((row[4] for row in rows if row[4]), default=None)
+
+    run_id = _start_scrape_run(cur, keyword, started_at)
+    _record_products(
+        cur,
+        run_id,
+        # Cards without a link ("#") have nothing to identify them by
+        [{'name': name, 'price': price, 'sold': sold, 'link': link}
+         for name, price, sold, link, _ in rows if link and link != "#"],
+        started_at
+    )
+    cur.execute(f"DROP TABLE {table_name}")
+
+
+def search_query(text):
+    """Turn free text into an FTS5 query matching every word as a prefix"""
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", text))
+
+
+def _migrate_normalized(conn):
+    conn.executescript(SCHEMA)
+    cur = conn.cursor()
+    cur.execute("BEGIN")
+    try:
+        cur.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'products\\_%' ESCAPE '\\'"
+        )
+        for (table_name,) in cur.fetchall():
+            _import_legacy_table(cur, table_name)
+        cur.execute("PRAGMA user_version = 2")
+        cur.execute("COMMIT")
+    except sqlite3.Error:
+        cur.execute("ROLLBACK")
+        raise
+
+
+def _migrate_search(conn):
+    conn.executescript(f"""BEGIN;
+        {SEARCH_SCHEMA}
+        INSERT INTO product_search (product_search) VALUES ('rebuild');
+        PRAGMA user_version = 3;
+        COMMIT;""")
+
+
+def _migrate_data_version(conn):
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(keywords)")]
+    alter = "" if "data_version" in columns else \
+        "ALTER TABLE keywords ADD COLUMN data_version INTEGER NOT NULL DEFAULT 0;"
+    conn.executescript(f"""BEGIN;
+        {alter}
+        PRAGMA user_version = 4;
+        COMMIT;""")
+
+
+def _migrate_product_ids(conn):
+    """Key products by item id, merging rows whose links point at the same item"""
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(products)")]
+    cur = conn.cursor()
+    cur.execute("BEGIN")
+    try:
+        if "item_id" not in columns:
+            cur.execute("ALTER TABLE products ADD COLUMN item_id INTEGER")
+            cur.execute("ALTER TABLE products ADD COLUMN sku_id INTEGER")
+        kept = {}
+        cur.execute("SELECT id, link FROM products WHERE item_id IS NULL ORDER BY id")
+        for product_id, link in cur.fetchall():
+            item_id, sku_id = product_ids(link)
+            if item_id is None:
+                continue
+            first = kept.setdefault(item_id, product_id)
+            if first == product_id:
+                cur.execute("UPDATE products SET item_id = ?, sku_id = ? WHERE id = ?", (item_id, sku_id, product_id))
+            else:
+                cur.execute("UPDATE observations SET product_id = ? WHERE product_id = ?", (first, product_id))
+                cur.execute("DELETE FROM products WHERE id = ?", (product_id,))
+        cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_products_item ON products (item_id)")
+        cur.execute("PRAGMA user_version = 5")
+        cur.execute("COMMIT")
+    except sqlite3.Error:
+        cur.execute("ROLLBACK")
+        raise
+
+
+def _migrate_current_state(conn):
+    """Move listings to keyword_products, seeded from each keyword's latest observations"""
+    conn.executescript(SCHEMA)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(scrape_runs)")]
+    cur = conn.cursor()
+    cur.execute("BEGIN")
+    try:
+        if "new_count" not in columns:
+            cur.execute("ALTER TABLE scrape_runs ADD COLUMN new_count INTEGER")
+            cur.execute("ALTER TABLE scrape_runs ADD COLUMN changed_count INTEGER")
+        cur.execute(
+            """INSERT OR IGNORE INTO keyword_products
+                   (keyword_id, product_id, position, price, sold, price_centavos, sold_count,
+                    first_seen_run, last_seen_run, last_changed_run, last_seen_at)
+               WITH seen AS (
+                   SELECT r.keyword_id, o.product_id,
+                          MIN(o.scrape_run_id) AS first_run, MAX(o.scrape_run_id) AS last_run
+                   FROM observations o JOIN scrape_runs r ON r.id = o.scrape_run_id
+                   GROUP BY r.keyword_id, o.product_id)
+               SELECT s.keyword_id, s.product_id, o.position, o.price, o.sold, o.price_centavos,
+                      o.sold_count, s.first_run, s.last_run, s.last_run, o.ts
+               FROM seen s
+               JOIN observations o ON o.id = (
+                   SELECT id FROM observations
+                   WHERE product_id = s.product_id AND scrape_run_id = s.last_run
+                   ORDER BY position LIMIT 1)"""
+        )
+        # Listings are read from keyword_products now, observations only need the per-product index
+        for suffix, columns in _SORT_INDEXES:
+            cur.execute(f"DROP INDEX IF EXISTS idx_observations_run_{suffix}")
+            cur.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_keyword_products_{suffix} "
+                f"ON keyword_products (keyword_id, last_seen_run, {columns})"
+            )
+        cur.execute("PRAGMA user_version = 6")
+        cur.execute("COMMIT")
+    except sqlite3.Error:
+        cur.execute("ROLLBACK")
+        raise
+
+
+def _migrate_price_stats(conn):
+    """Add price_stats and price_drops, with stats for each keyword's latest run"""
+    conn.executescript(SCHEMA)
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(keyword_products)")]
+    cur = conn.cursor()
+    cur.execute("BEGIN")
+    try:
+        if "previous_price_centavos" not in columns:
+            cur.execute("ALTER TABLE keyword_products ADD COLUMN previous_price_centavos INTEGER")
+        cur.execute("SELECT keyword_id, MAX(id) FROM scrape_runs GROUP BY keyword_id")
+        for keyword_id, run_id in cur.fetchall():
+            _record_price_stats(cur, keyword_id, run_id)
+        cur.execute("PRAGMA user_version = 7")
+        cur.execute("COMMIT")
+    except sqlite3.Error:
+        cur.execute("ROLLBACK")
+        raise
+
+
+def _migrate_rename_versions(conn):
+    conn.executescript(f"""BEGIN;
+        {VERSION_SCHEMA}
+        PRAGMA user_version = 8;
+        COMMIT;""")
+
+
+def migrate(conn):
+    """Bring the schema up to SCHEMA_VERSION, importing the old per-keyword products_* tables"""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version < 2:
+        _migrate_normalized(conn)
+    if version < 3:
+        _migrate_search(conn)
+    if version < 4:
+        _migrate_data_version(conn)
+    if version < 5:
+        _migrate_product_ids(conn)
+    if version < 6:
+        _migrate_current_state(conn)
+    if version < 7:
+        _migrate_price_stats(conn)
+    if version < 8:
+        _migrate_rename_versions(conn)
+
+
+class QueryCache:
+    """LRU of query results, each tagged with the data version it was read at.
+
+    A lookup only hits when the caller's current version matches, so a new
+    scrape of a keyword makes its cached views miss without any
+    coordination; invalidate() additionally frees them right away.
+    """
+
+    def __init__(self, maxsize=QUERY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, key, version, rows):
+        with self._lock:
+            self._entries[key] = (version, rows)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, keyword=None):
+        """Drop the cached views of keyword (and all searches), or everything"""
+        with self._lock:
+            for key in list(self._entries):
+                if keyword is None or key[0] in (keyword, None):
+                    del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+            }
+
+
+class ConnectionManager:
+    """Process-wide access to one database file.
+
+    A single writer thread owns the only writable connection and applies
+    queued writes in batches, one transaction per batch; reads borrow
+    read-only connections from a small pool. With WAL journaling readers
+    never wait for the writer and the writer never waits for readers.
+    """
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, db_name, journal_mode="WAL", synchronous="NORMAL"):
+        key = os.path.abspath(db_name)
+        with cls._instances_lock:
+            manager = cls._instances.get(key)
+            if manager is None or manager.closed:
+                manager = cls(db_name, journal_mode, synchronous)
+                cls._instances[key] = manager
+            return manager
+
+    @classmethod
+    def close_all(cls):
+        with cls._instances_lock:
+            managers = list(cls._instances.values())
+            cls._instances.clear()
+        for manager in managers:
+            manager.close()
+
+    def __init__(self, db_name, journal_mode="WAL", synchronous="NORMAL"):
         self.db_name = db_name
-        self.conn = None
-        self.cursor = None
-        self.connect()
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.closed = False
+        self.cache = QueryCache()
+        self._writes = queue.Queue()
+        self._readers = queue.LifoQueue(maxsize=READ_POOL_SIZE)
+        self._ready = threading.Event()
+        self._writer = threading.Thread(target=self._write_loop, name="sqlite-writer", daemon=True)
+        self._writer.start()
+        self._ready.wait()
+
+    def _open(self, read_only=False):
+        if read_only:
+            uri = pathlib.Path(self.db_name).absolute().as_uri() + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False, isolation_level=None)
+        else:
+            conn = sqlite3.connect(self.db_name, check_same_thread=False, isolation_level=None)
+            if self.journal_mode:
+                conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+            if self.synchronous:
+                conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        return conn
+
+    @contextlib.contextmanager
+    def reading(self):
+        """Borrow a read-only connection from the pool"""
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            conn = self._open(read_only=True)
+        try:
+            yield conn
+        finally:
+            try:
+                self._readers.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    def submit_write(self, func, *args):
+        """Queue func(cursor, *args) for the writer thread, returns a Future of its result"""
+        if self.closed:
+            raise sqlite3.ProgrammingError("Connection manager is closed")
+        future = Future()
+        self._writes.put((future, func, args))
+        return future
 
-    def connect(self):
+    def write(self, func, *args):
+        """Run func(cursor, *args) on the writer thread and wait until it is committed"""
+        return self.submit_write(func, *args).result()
+
+    def _run_batch(self, conn, jobs):
+        results = []
+        cur = conn.cursor()
         try:
-            self.conn = sqlite3.connect(self.db_name, check_same_thread=False)
-            self.cursor = self.conn.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            for future, func, args in jobs:
+                # A failing job only rolls back its own savepoint, not the batch
+                cur.execute("SAVEPOINT job")
+                try:
+                    results.append((future, func(cur, *args), None))
+                    cur.execute("RELEASE job")
+                except Exception as e:
+                    cur.execute("ROLLBACK TO job")
+                    cur.execute("RELEASE job")
+                    results.append((future, None, e))
+            cur.execute("COMMIT")
         except sqlite3.Error as e:
-            print(f"Error connecting to SQLite Database: {e}")
-
-    def create_table(self, keyword):
-        # Replace spaces with underscores in table name
-        table_name = f"products_{keyword.replace(' ', '_')}"
-        query = f"""CREATE TABLE IF NOT EXISTS {table_name} (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    name TEXT NOT NULL,
-                    price TEXT NOT NULL,
-                    sold TEXT NOT NULL,
-                    link TEXT NOT NULL,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                );"""
-        try:
-            self.cursor.execute(query)
-            self.conn.commit()
-            return table_name
+            if conn.in_transaction:
+                cur.execute("ROLLBACK")
+            results = [(future, None, e) for future, _, _ in jobs]
+
+        for future, result, error in results:
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def _write_loop(self):
+        try:
+            conn = self._open()
         except sqlite3.Error as e:
-            print(f"Error creating table: {e}")
-            return None
-        
-    def clear_table(self, table_name):
-        query = f"DELETE FROM {table_name}"
-        try:
-            self.cursor.execute(query)
-            self.conn.commit()
-            print(f"Cleared table: {table_name}")
-            return True
+            # Closed right away, so writes fail with an error instead of waiting forever
+            print(f"Error opening database: {e}")
+            self.closed = True
+            self._ready.set()
+            return
+        try:
+            migrate(conn)
         except sqlite3.Error as e:
-            print(f"Error clearing table {table_name}: {e}")
-            return False
-        
-    def insert_product(self, table_name, product):
-        query = f"""INSERT INTO {table_name} (name, price, sold, link)
-                   VALUES (?, ?, ?, ?);"""
-        try:
-            self.cursor.execute(query, (product['name'], product['price'], product['sold'], product['link']))
-            self.conn.commit()
+            print(f"Error migrating database: {e}")
+        finally:
+            self._ready.set()
+
+        running = True
+        while running:
+            jobs = [self._writes.get()]
+            while len(jobs) < WRITE_BATCH_SIZE:
+                try:
+                    jobs.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            running = None not in jobs
+            jobs = [job for job in jobs if job is not None]
+            if jobs:
+                self._run_batch(conn, jobs)
+        conn.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._writes.put(None)
+        self._writer.join()
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+atexit.register(ConnectionManager.close_all)
+
+
+class DatabaseManager:
+    """Database API used by the scrapers and the GUI.
+
+    Instances are cheap: they all share the ConnectionManager of their
+    database file, so there is nothing to open or close per instance.
+    """
+
+    def __init__(self, db_name, journal_mode="WAL", synchronous="NORMAL"):
+        self.db_name = db_name
+        self.manager = ConnectionManager.get(db_name, journal_mode, synchronous)
+
+    def _fetchall(self, query, params=()):
+        with self.manager.reading() as conn:
+            return conn.execute(query, params).fetchall()
+
+    def _cached_fetchall(self, key, version_query, version_params, query, params):
+        """_fetchall through the query cache; the version is read before the rows"""
+        cache = self.manager.cache
+        with self.manager.reading() as conn:
+            version = conn.execute(version_query, version_params).fetchone()[0]
+            rows = cache.get(key, version)
+            if rows is None:
+                rows = conn.execute(query, params).fetchall()
+                cache.put(key, version, rows)
+        return rows
+
+    def cache_stats(self):
+        return self.manager.cache.stats()
+
+    @staticmethod
+    def _write_products(cur, keyword, products):
+        run_id = _start_scrape_run(cur, keyword)
+        return _record_products(cur, run_id, products)
+
+    def insert_products(self, keyword, products):
+        """Record one scrape of keyword in a single transaction.
+
+        Returns the number of products stored, or None when the write failed.
+        """
+        products = list(products)
+        start = time.perf_counter()
+        try:
+            stored, new, changed = self.manager.write(self._write_products, keyword, products)
         except sqlite3.Error as e:
-            print(f"Error inserting product: {e}")
-
-    def get_products(self, table_name, sort_option='default'):
-        base_query = f"""SELECT name, price, sold, link FROM {table_name}"""
-        
-        if sort_option == 'price_low_to_high':
-            base_query += """
-                ORDER BY 
-                    CAST(REPLACE(REPLACE(price, '₱', ''), ',', '') AS REAL) ASC,
-                    CASE 
-                        WHEN sold LIKE '%K%' THEN 
-                            CAST(REPLACE(REPLACE(REPLACE(sold, ' sold/month', ''), 'K', ''), '+', '') AS REAL) * 1000
-                        WHEN sold LIKE '%+%' THEN 
-                            10000
-                        ELSE 
-                            CAST(REPLACE(REPLACE(sold, ' sold/month', ''), ',', '') AS INTEGER)
-                    END DESC"""
-        elif sort_option == 'price_high_to_low':
-            base_query += """
-                ORDER BY 
-                    CAST(REPLACE(REPLACE(price, '₱', ''), ',', '') AS REAL) DESC,
-                    CASE 
-                        WHEN sold LIKE '%K%' THEN 
-                            CAST(REPLACE(REPLACE(REPLACE(sold, ' sold/month', ''), 'K', ''), '+', '') AS REAL) * 1000
-                        WHEN sold LIKE '%+%' THEN 
-                            10000
-                        ELSE 
-                            CAST(REPLACE(REPLACE(sold, ' sold/month', ''), ',', '') AS INTEGER)
-                    END DESC"""
-        elif sort_option == 'sold_high_to_low':
-            base_query += """
-                ORDER BY 
-                    CASE 
-                        WHEN sold LIKE '%K%' THEN 
-                            CAST(REPLACE(REPLACE(REPLACE(sold, ' sold/month', ''), 'K', ''), '+', '') AS REAL) * 1000
-                        WHEN sold LIKE '%+%' THEN 
-                            10000
-                        ELSE 
-                            CAST(REPLACE(REPLACE(sold, ' sold/month', ''), ',', '') AS INTEGER)
-                    END DESC,
-                    CAST(REPLACE(REPLACE(price, '₱', ''), ',', '') AS REAL) ASC"""
-        elif sort_option == 'sold_low_to_high':
-            base_query += """
-                ORDER BY 
-                    CASE 
-                        WHEN sold LIKE '%K%' THEN 
-                            CAST(REPLACE(REPLACE(REPLACE(sold, ' sold/month', ''), 'K', ''), '+', '') AS REAL) * 1000
-                        WHEN sold LIKE '%+%' THEN 
-                            10000
-                        ELSE 
-                            CAST(REPLACE(REPLACE(sold, ' sold/month', ''), ',', '') AS INTEGER)
-                    END ASC,
-                    CAST(REPLACE(REPLACE(price, '₱', ''), ',', '') AS REAL) ASC"""
-        else:  # default
-            base_query += """ ORDER BY timestamp DESC"""
-            
-        try:
-            self.cursor.execute(base_query)
-            return self.cursor.fetchall()
+            print(f"Error inserting products: {e}")
+            return None
+        self.manager.cache.invalidate(keyword)
+
+        elapsed = time.perf_counter() - start
+        rate = len(products) / elapsed if elapsed > 0 else float('inf')
+        merged = f", {len(products) - stored} duplicates merged" if stored < len(products) else ""
+        print(f"Inserted {stored} products for '{keyword}' ({new} new, {changed} changed, "
+              f"{stored - new - changed} unchanged{merged}) in {elapsed:.3f}s ({rate:,.0f} rows/sec)")
+        return stored
+
+    def get_products(self, keyword, sort_option='default', limit=None, offset=0):
+        """Products from the latest scrape of keyword, optionally one window of rows"""
+        order_by = _SORT_ORDERS.get(sort_option, _SORT_ORDERS['default'])
+        query = f"""SELECT p.name, kp.price, kp.sold, p.link
+                    FROM keyword_products kp
+                    JOIN products p ON p.id = kp.product_id
+                    WHERE (kp.keyword_id, kp.last_seen_run) = (
+                        SELECT r.keyword_id, MAX(r.id) FROM scrape_runs r
+                        JOIN keywords k ON k.id = r.keyword_id
+                        WHERE k.keyword = ?)
+                    ORDER BY {order_by}
+                    LIMIT ? OFFSET ?"""
+        try:
+            return self._cached_fetchall(
+                (keyword, sort_option, None, offset, limit),
+                "SELECT MAX(data_version) FROM keywords WHERE keyword = ?", (keyword,),
+                query, (keyword, -1 if limit is None else limit, offset)
+            )
         except sqlite3.Error as e:
             print(f"Error retrieving products: {e}")
             return []
-        
-    def get_all_product_tables(self):
-        query = "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'products_%'"
-        try:
-            self.cursor.execute(query)
-            tables = self.cursor.fetchall()
-            # Extract keywords from table names (remove 'products_' prefix)
-            return [table[0].replace('products_', '').replace('_', ' ') for table in tables]
+
+    def _export_query(self, select, keyword, filter_text, order_by=""):
+        query = f"""SELECT {select}
+                    FROM keyword_products kp
+                    JOIN products p ON p.id = kp.product_id
+                    WHERE (kp.keyword_id, kp.last_seen_run) = (
+                        SELECT r.keyword_id, MAX(r.id) FROM scrape_runs r
+                        JOIN keywords k ON k.id = r.keyword_id
+                        WHERE k.keyword = ?)"""
+        params = [keyword]
+        match = search_query(filter_text or "")
+        if match:
+            query += " AND kp.product_id IN (SELECT rowid FROM product_search WHERE product_search MATCH ?)"
+            params.append(match)
+        return query + order_by, params
+
+    def count_products(self, keywords=None, filter_text=None):
+        """Rows iter_products would yield"""
+        total = 0
+        try:
+            with self.manager.reading() as conn:
+                for keyword in keywords or self.get_keywords():
+                    query, params = self._export_query("COUNT(*)", keyword, filter_text)
+                    total += conn.execute(query, params).fetchone()[0]
         except sqlite3.Error as e:
-            print(f"Error getting tables: {e}")
+            print(f"Error counting products: {e}")
+        return total
+
+    def iter_products(self, keywords=None, sort_option='default', filter_text=None, batch_size=1000):
+        """Yield lists of at most batch_size EXPORT_COLUMNS rows from the latest scrape of each keyword.
+
+        Keywords default to all of them; filter_text keeps products whose
+        name matches it as in search_products. Rows are pulled with
+        fetchmany from one read connection, so memory does not grow with
+        the number of rows.
+        """
+        order_by = f" ORDER BY {_SORT_ORDERS.get(sort_option, _SORT_ORDERS['default'])}"
+        select = "?, p.name, kp.price, kp.sold, kp.price_centavos, kp.sold_count, p.link, p.item_id, p.sku_id, kp.position, kp.last_seen_at"
+        with self.manager.reading() as conn:
+            for keyword in keywords or self.get_keywords():
+                query, params = self._export_query(select, keyword, filter_text, order_by)
+                cursor = conn.execute(query, [keyword] + params)
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    yield rows
+
+    def get_changes(self, keyword):
+        """(name, price, sold, link, status) of the products the latest scrape of keyword found
+        new ('new') or with a different price or sold count ('changed'), in listing order"""
+        query = """SELECT p.name, kp.price, kp.sold, p.link,
+                          CASE WHEN kp.first_seen_run = kp.last_changed_run THEN 'new' ELSE 'changed' END
+                   FROM keyword_products kp
+                   JOIN products p ON p.id = kp.product_id
+                   WHERE (kp.keyword_id, kp.last_changed_run) = (
+                       SELECT r.keyword_id, MAX(r.id) FROM scrape_runs r
+                       JOIN keywords k ON k.id = r.keyword_id
+                       WHERE k.keyword = ?)
+                   ORDER BY kp.position"""
+        try:
+            return self._fetchall(query, (keyword,))
+        except sqlite3.Error as e:
+            print(f"Error retrieving changes: {e}")
             return []
-        
+
+    def get_price_stats(self, keyword, runs=1):
+        """Price summaries of the latest runs of keyword, newest first.
+
+        Each is a dict of run_id, started_at, product_count, priced_count,
+        the min/max/mean/p25/median/p75/p90 prices in centavos and histogram,
+        the product counts per PRICE_HISTOGRAM_EDGES bucket.
+        """
+        query = """SELECT s.scrape_run_id, r.started_at, s.product_count, s.priced_count,
+                          s.min_centavos, s.max_centavos, s.mean_centavos, s.p25_centavos,
+                          s.median_centavos, s.p75_centavos, s.p90_centavos, s.histogram
+                   FROM price_stats s
+                   JOIN scrape_runs r ON r.id = s.scrape_run_id
+                   WHERE s.keyword_id = (SELECT id FROM keywords WHERE keyword = ?)
+                   ORDER BY s.scrape_run_id DESC
+                   LIMIT ?"""
+        fields = ('run_id', 'started_at', 'product_count', 'priced_count', 'min', 'max', 'mean',
+                  'p25', 'median', 'p75', 'p90', 'histogram')
+        try:
+            rows = self._fetchall(query, (keyword, runs))
+        except sqlite3.Error as e:
+            print(f"Error retrieving price stats: {e}")
+            return []
+        return [dict(zip(fields, row[:-1]), histogram=json.loads(row[-1])) for row in rows]
+
+    def get_price_drops(self, keyword, min_percent=0):
+        """(name, old_centavos, new_centavos, percent, link) of products whose price fell by more
+        than min_percent in the latest scrape of keyword, biggest drop first"""
+        query = """SELECT p.name, d.old_centavos, d.new_centavos,
+                          (d.old_centavos - d.new_centavos) * 100.0 / d.old_centavos AS percent, p.link
+                   FROM price_drops d
+                   JOIN products p ON p.id = d.product_id
+                   WHERE d.scrape_run_id = (
+                       SELECT MAX(r.id) FROM scrape_runs r
+                       JOIN keywords k ON k.id = r.keyword_id
+                       WHERE k.keyword = ?)
+                     AND percent > ?
+                   ORDER BY percent DESC"""
+        try:
+            return self._fetchall(query, (keyword, min_percent))
+        except sqlite3.Error as e:
+            print(f"Error retrieving price drops: {e}")
+            return []
+
+    def get_latest_prices(self, keywords=None):
+        """(keyword, name, link, price, sold, ts) of the newest observation of each product"""
+        query = """SELECT k.keyword, p.name, p.link, o.price, o.sold, o.ts
+                   FROM products p
+                   JOIN observations o ON o.id = (
+                       SELECT id FROM observations
+                       WHERE product_id = p.id
+                       ORDER BY scrape_run_id DESC LIMIT 1)
+                   JOIN scrape_runs r ON r.id = o.scrape_run_id
+                   JOIN keywords k ON k.id = r.keyword_id"""
+        params = ()
+        if keywords:
+            query += f" WHERE k.keyword IN ({', '.join('?' for _ in keywords)})"
+            params = tuple(keywords)
+        try:
+            return self._fetchall(query, params)
+        except sqlite3.Error as e:
+            print(f"Error retrieving latest prices: {e}")
+            return []
+
+    def get_price_history(self, link):
+        """(ts, price_centavos, sold_count) for every observation of the product, oldest first.
+
+        Any link to the same item finds the same history.
+        """
+        query = f"""SELECT o.ts, o.price_centavos, o.sold_count
+                    FROM observations o
+                    WHERE o.product_id = {_PRODUCT_ID}
+                    ORDER BY o.scrape_run_id"""
+        try:
+            return self._fetchall(query, (product_ids(link)[0], link))
+        except sqlite3.Error as e:
+            print(f"Error retrieving price history: {e}")
+            return []
+
+    def search_products(self, text, limit=50, offset=0):
+        """(name, price, sold, link, keyword) of products whose name matches text, best match first.
+
+        Searches every keyword; price, sold and keyword come from each
+        product's latest observation.
+        """
+        query = search_query(text)
+        if not query:
+            return []
+        sql = """SELECT p.name, o.price, o.sold, p.link, k.keyword
+                 FROM (SELECT rowid AS id, rank FROM product_search
+                       WHERE product_search MATCH ?
+                       ORDER BY rank LIMIT ? OFFSET ?) m
+                 JOIN products p ON p.id = m.id
+                 JOIN observations o ON o.id = (
+                     SELECT id FROM observations
+                     WHERE product_id = p.id
+                     ORDER BY scrape_run_id DESC LIMIT 1)
+                 JOIN scrape_runs r ON r.id = o.scrape_run_id
+                 JOIN keywords k ON k.id = r.keyword_id
+                 ORDER BY m.rank"""
+        try:
+            return self._cached_fetchall(
+                (None, None, query, offset, limit),
+                "SELECT TOTAL(data_version) FROM keywords", (),
+                sql, (query, limit, offset)
+            )
+        except sqlite3.Error as e:
+            print(f"Error searching products: {e}")
+            return []
+
+    def count_search_products(self, text):
+        """Rows iter_search_products(text) would yield"""
+        query = search_query(text)
+        if not query:
+            return 0
+        try:
+            return self._fetchall("SELECT COUNT(*) FROM product_search WHERE product_search MATCH ?", (query,))[0][0]
+        except sqlite3.Error as e:
+            print(f"Error counting search results: {e}")
+            return 0
+
+    def iter_search_products(self, text, batch_size=1000):
+        """Yield lists of at most batch_size EXPORT_COLUMNS rows for every product matching text.
+
+        The streaming counterpart of search_products: same order and one
+        row per product, with the product's latest observation.
+        """
+        query = search_query(text)
+        if not query:
+            return
+        sql = """SELECT k.keyword, p.name, o.price, o.sold, o.price_centavos, o.sold_count, p.link,
+                        p.item_id, p.sku_id, o.position, o.ts
+                 FROM (SELECT rowid AS id, rank FROM product_search
+                       WHERE product_search MATCH ?) m
+                 JOIN products p ON p.id = m.id
+                 JOIN observations o ON o.id = (
+                     SELECT id FROM observations
+                     WHERE product_id = p.id
+                     ORDER BY scrape_run_id DESC LIMIT 1)
+                 JOIN scrape_runs r ON r.id = o.scrape_run_id
+                 JOIN keywords k ON k.id = r.keyword_id
+                 ORDER BY m.rank"""
+        with self.manager.reading() as conn:
+            cursor = conn.execute(sql, (query,))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+
+    def get_catalog(self):
+        """(keyword, product_count, last_scraped_at) of every saved search, by keyword.
+
+        Read from the keywords table and each keyword's latest run, so it
+        stays a handful of index lookups whatever the number of products.
+        """
+        query = """SELECT k.keyword, COALESCE(s.product_count, r.product_count, 0), r.started_at
+                   FROM keywords k
+                   LEFT JOIN scrape_runs r ON r.id = (
+                       SELECT MAX(id) FROM scrape_runs WHERE keyword_id = k.id)
+                   LEFT JOIN price_stats s ON s.scrape_run_id = r.id
+                   ORDER BY k.keyword"""
+        try:
+            return self._fetchall(query)
+        except sqlite3.Error as e:
+            print(f"Error getting saved searches: {e}")
+            return []
+
+    def get_keywords(self):
+        query = "SELECT keyword FROM keywords ORDER BY keyword"
+        try:
+            return [row[0] for row in self._fetchall(query)]
+        except sqlite3.Error as e:
+            print(f"Error getting keywords: {e}")
+            return []
+
     def close(self):
-        if self.conn:
-            self.conn.close()
+        """Kept for callers; connections belong to the shared ConnectionManager"""
@@ -0,0 +1,181 @@
+"""Streaming export of saved searches to CSV, JSONL, Parquet or Arrow.
+
+    python -m exporter products.csv
+    python -m exporter fans.parquet --keyword "mini fan" --sort price_low_to_high --filter usb
+    python -m exporter usb.jsonl --search usb
+
+Rows come from DatabaseManager.iter_products (or iter_search_products for
+--search) in batches and are written as they arrive, so memory stays flat whatever the row count. price (pesos)
+and sold (items) are numeric; the text Lazada showed is kept in
+price_text and sold_text. Parquet and Arrow need pyarrow.
+"""
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+from config import LAZADA_DB_NAME
+from database import DatabaseManager
+
+FIELDS = ('keyword', 'name', 'price', 'sold', 'price_text', 'sold_text', 'link',
+          'item_id', 'sku_id', 'position', 'last_seen_at')
+FORMATS = ('csv', 'jsonl', 'parquet', 'arrow')
+BATCH_SIZE = 5000
+# Rows buffered per Parquet row group / Arrow record batch
+ARROW_BATCH_ROWS = 65536
+
+
+def export_row(row):
+    """An iter_products or iter_search_products row as a FIELDS tuple"""
+    keyword, name, price, sold, price_centavos, sold_count, link, item_id, sku_id, position, last_seen_at = row
+    return (keyword, name, price_centavos / 100 if price_centavos is not None else None, sold_count,
+            price, sold, link, item_id, sku_id, position, last_seen_at)
+
+
+class CsvWriter:
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(FIELDS)
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class JsonlWriter:
+    def __init__(self, path):
+        self.file = open(path, 'w', encoding='utf-8')
+
+    def write(self, rows):
+        self.file.writelines(json.dumps(dict(zip(FIELDS, row)), ensure_ascii=False) + "\n" for row in rows)
+
+    def close(self):
+        self.file.close()
+
+
+class ArrowWriter:
+    """Parquet or Arrow IPC file, written one bounded buffer of rows at a time"""
+
+    def __init__(self, path, parquet=True):
+        try:
+            import pyarrow as pa
+        except ImportError:
+            raise ImportError("Parquet and Arrow export need pyarrow: pip install pyarrow") from None
+        self.pa = pa
+        self.schema = pa.schema([
+            ('keyword', pa.string()), ('name', pa.string()), ('price', pa.float64()), ('sold', pa.int64()),
+            ('price_text', pa.string()), ('sold_text', pa.string()), ('link', pa.string()),
+            ('item_id', pa.int64()), ('sku_id', pa.int64()), ('position', pa.int32()),
+            ('last_seen_at', pa.string()),
+        ])
+        if parquet:
+            import pyarrow.parquet as pq
+            self.writer = pq.ParquetWriter(path, self.schema)
+        else:
+            self.writer = pa.ipc.new_file(path, self.schema)
+        self.buffer = []
+
+    def _flush(self):
+        if not self.buffer:
+            return
+        columns = list(zip(*self.buffer))
+        self.writer.write_table(self.pa.Table.from_arrays(
+            [self.pa.array(column, type=field.type) for column, field in zip(columns, self.schema)],
+            schema=self.schema
+        ))
+        self.buffer = []
+
+    def write(self, rows):
+        self.buffer.extend(rows)
+        if len(self.buffer) >= ARROW_BATCH_ROWS:
+            self._flush()
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+
+
+def open_writer(path, fmt):
+    if fmt == 'csv':
+        return CsvWriter(path)
+    if fmt == 'jsonl':
+        return JsonlWriter(path)
+    if fmt in ('parquet', 'arrow'):
+        return ArrowWriter(path, parquet=fmt == 'parquet')
+    raise ValueError(f"Unknown export format: {fmt}")
+
+
+def format_for(path):
+    """The export format named by path's extension"""
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    extension = {'ndjson': 'jsonl', 'feather': 'arrow', 'pq': 'parquet'}.get(extension, extension)
+    if extension not in FORMATS:
+        raise ValueError(f"Cannot tell the export format from {path!r}, use one of: {', '.join(FORMATS)}")
+    return extension
+
+
+def export(path, fmt=None, keywords=None, sort_option='default', filter_text=None, db_name=LAZADA_DB_NAME,
+           batch_size=BATCH_SIZE, progress=None, search_text=None):
+    """Write the latest results of keywords (all by default) to path, returns the number of rows.
+
+    With search_text the rows are instead what the GUI's find box shows:
+    every product matching it across all keywords, best match first.
+    progress(rows_written, total_rows) is called after every batch.
+    """
+    db = DatabaseManager(db_name)
+    if search_text:
+        total = db.count_search_products(search_text) if progress else None
+        batches = db.iter_search_products(search_text, batch_size)
+    else:
+        total = db.count_products(keywords, filter_text) if progress else None
+        batches = db.iter_products(keywords, sort_option, filter_text, batch_size)
+    writer = open_writer(path, fmt or format_for(path))
+    written = 0
+    try:
+        for rows in batches:
+            writer.write([export_row(row) for row in rows])
+            written += len(rows)
+            if progress:
+                progress(written, total)
+    finally:
+        writer.close()
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m exporter", description="Export saved searches")
+    parser.add_argument("output", help="file to write; the format follows the extension unless --format is given")
+    parser.add_argument("--format", choices=FORMATS)
+    parser.add_argument("--keyword", action="append", dest="keywords",
+                        help="saved search to export, may be repeated (default: all)")
+    parser.add_argument("--sort", default="default",
+                        choices=("default", "price_low_to_high", "price_high_to_low", "sold_high_to_low",
+                                 "sold_low_to_high"))
+    parser.add_argument("--filter", help="only products of each saved search whose name matches")
+    parser.add_argument("--search", help="export the GUI's find box results for this text instead: "
+                                         "matching products across all saved searches, best match first")
+    parser.add_argument("--db", default=LAZADA_DB_NAME, help=f"database file (default {LAZADA_DB_NAME})")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    def report(written, total):
+        print(f"\rExported {written:,} of {total:,} rows", end="", file=sys.stderr, flush=True)
+
+    try:
+        written = export(args.output, args.format, args.keywords, args.sort, args.filter, args.db,
+                         args.batch_size, report, args.search)
+    except (ImportError, ValueError) as e:
+        parser.error(str(e))
+    except sqlite3.Error as e:
+        print(f"\nError exporting products: {e}", file=sys.stderr)
+        return 1
+    print(f"\rExported {written:,} rows to {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
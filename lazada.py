@@ -1,11 +1,21 @@
 import threading
-import webbrowser
 import os
+import sqlite3
 import tkinter as tk
-from tkinter import ttk, messagebox
-from config import LAZADA_COOKIE_FILE, LAZADA_DB_NAME
+from tkinter import ttk, messagebox, filedialog
+from config import (LAZADA_COOKIE_FILE, LAZADA_DB_NAME, LAZADA_GUI_CHUNK_ROWS, LAZADA_GUI_WINDOW_CHUNKS,
+                    LAZADA_PRICE_DROP_PERCENT)
 from database import DatabaseManager
-from lazada_scraper import LazadaScraper
+from exporter import export
+
+SORT_MAPPING = {
+    "default (original order)": "default",
+    "price (low to high)": "price_low_to_high",
+    "price (high to low)": "price_high_to_low",
+    "sold (high to low)": "sold_high_to_low",
+    "sold (low to high)": "sold_low_to_high"
+}
+
 
 class LazadaGUI:
     def __init__(self, root):
@@ -13,7 +23,23 @@ class LazadaGUI:
         self.root.title("Lazada Price Scraper")
         self.db = DatabaseManager(LAZADA_DB_NAME)
         self.keyword = ""
+        self.service = None
+        # The table only holds a window of LAZADA_GUI_CHUNK_ROWS chunks around the
+        # visible rows; the scrollbar is sized from the query's row count
+        self.query_generation = 0
+        self.total_rows = 0
+        self.window_start = 0
+        self.window_end = 0
+        self.window_rows = 0
+        self.window_chunks = {}
+        self.target_row = 0
+        self.loading_rows = False
+        self.row_id_counts = {}
+        self.row_fetcher = None
+        # Saved-search combobox labels -> keyword
+        self.catalog = {}
         self.setup_gui()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
 
     def setup_gui(self):
         main_frame = ttk.Frame(self.root)
@@ -79,28 +105,55 @@ class LazadaGUI:
 
         self.sort_variable.trace('w', lambda *args: self.refresh_data())
 
-        self.tree = ttk.Treeview(main_frame)
-        self.tree['columns'] = ('Name', 'Price', 'Sold', 'Link')
+        filter_frame = ttk.Frame(main_frame)
+        filter_frame.pack(fill="x", pady=5)
+
+        ttk.Label(filter_frame, text="Find in all searches:").pack(side="left")
+        self.filter_var = tk.StringVar()
+        self.filter_entry = ttk.Entry(filter_frame, textvariable=self.filter_var)
+        self.filter_entry.pack(side="left", padx=5, fill="x", expand=True)
+        self.filter_entry.bind("<Return>", lambda event: self.refresh_data())
+
+        ttk.Button(filter_frame, text="Find", command=self.refresh_data).pack(side="left")
+        ttk.Button(filter_frame, text="Clear", command=self.clear_filter).pack(side="left", padx=5)
+
+        self.stats_var = tk.StringVar()
+        ttk.Label(main_frame, textvariable=self.stats_var).pack(anchor="w")
+
+        tree_frame = ttk.Frame(main_frame)
+        tree_frame.pack(fill="both", expand=True, pady=10)
+
+        self.tree = ttk.Treeview(tree_frame)
+        self.tree_scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=self.on_scrollbar)
+        self.tree.configure(yscrollcommand=self.on_tree_scroll)
+        self.tree['columns'] = ('Name', 'Price', 'Sold', 'Link', 'Keyword')
+        self.tree['displaycolumns'] = ('Name', 'Price', 'Sold', 'Link')
     
         self.tree.column("#0", width=0, stretch='no')
         self.tree.column("Name", anchor='w', width=250)
         self.tree.column("Price", anchor='w', width=100)
         self.tree.column("Sold", anchor='w', width=100)
         self.tree.column("Link", anchor='w', width=200)
+        self.tree.column("Keyword", anchor='w', width=120)
         
         self.tree.heading("#0", text='', anchor='w')
         self.tree.heading('Name', text='Name', anchor='w')
         self.tree.heading('Price', text='Price', anchor='w')
         self.tree.heading('Sold', text='Sold', anchor='w')
         self.tree.heading('Link', text='Link', anchor='w')
+        self.tree.heading('Keyword', text='Keyword', anchor='w')
         
         self.tree.bind('<Button-1>', self.on_tree_click)
 
-        self.tree.pack(fill="both", expand=True, pady=10)
+        self.tree_scrollbar.pack(side="right", fill="y")
+        self.tree.pack(side="left", fill="both", expand=True)
 
         refresh_button = ttk.Button(main_frame, text="Refresh", command=self.refresh_data)
         refresh_button.pack(fill="x", pady=5)
 
+        self.export_button = ttk.Button(main_frame, text="Export...", command=self.export_results)
+        self.export_button.pack(fill="x")
+
         page_frame = ttk.Frame(main_frame)
         page_frame.pack(fill="x", pady=5)
 
@@ -110,7 +163,8 @@ class LazadaGUI:
         self.page_entry = ttk.Entry(page_frame, textvariable=self.page_var, width=5)
         self.page_entry.pack(side="left", padx=5)
 
-        self.refresh_table_list()
+        # Let the window paint before the first database read
+        self.root.after_idle(self.refresh_table_list)
 
     def on_tree_click(self, event):
         region = self.tree.identify("region", event.x, event.y)
@@ -118,33 +172,46 @@ class LazadaGUI:
             column = self.tree.identify_column(event.x)
             item = self.tree.focus()
             if column == "#4":
+                import webbrowser
                 link = self.tree.item(item)['values'][3]
                 webbrowser.open(link)
 
+    @staticmethod
+    def catalog_label(keyword, product_count, last_scraped_at):
+        if last_scraped_at is None:
+            return keyword
+        return f"{keyword} ({product_count} products, {last_scraped_at[:16]})"
+
     def refresh_table_list(self):
-        db = DatabaseManager(LAZADA_DB_NAME)
-        db.connect()
-        tables = db.get_all_product_tables()
-        db.close()
-        
-        self.table_dropdown['values'] = tables
-        if tables:
+        self.catalog = {self.catalog_label(*entry): entry[0] for entry in self.db.get_catalog()}
+
+        self.table_dropdown['values'] = list(self.catalog)
+        if self.catalog:
             if not self.table_var.get():
-                self.table_var.set(tables[0])
+                self.table_var.set(next(iter(self.catalog)))
                 self.load_selected_table()
 
+    def select_keyword(self, keyword):
+        """Point the saved-search combobox at keyword"""
+        labels = [label for label, entry in self.catalog.items() if entry == keyword]
+        self.table_var.set(labels[0] if labels else keyword)
+
     def load_selected_table(self, event=None):
-        selected_keyword = self.table_var.get()
+        selected_keyword = self.catalog.get(self.table_var.get(), self.table_var.get())
         if selected_keyword:
             self.keyword = selected_keyword
+            self.filter_var.set("")
             self.refresh_data()
     
     def delete_cookies(self):
-        scraper = LazadaScraper(self.root)
-        if scraper.delete_cookies():
+        # Removing the file directly keeps Playwright from loading for it
+        try:
+            os.remove(LAZADA_COOKIE_FILE)
             messagebox.showinfo("Success", "Cookies deleted successfully")
-        else:
-            messagebox.showwarning("Info", "No cookies found or error occurred")
+        except FileNotFoundError:
+            messagebox.showwarning("Info", "No cookies found")
+        except OSError as e:
+            messagebox.showwarning("Info", f"Could not delete cookies: {e}")
 
     def start_scraping(self):
         keyword = self.search_entry.get()
@@ -159,30 +226,29 @@ class LazadaGUI:
         username = self.username_entry.get()
         password = self.password_entry.get()
 
-        scraping_thread = threading.Thread(
-            target=self.scrape_products, 
-            args=(keyword, username, password)
+        try:
+            max_pages = int(self.page_var.get())
+        except ValueError:
+            max_pages = 3
+
+        if os.path.exists(LAZADA_COOKIE_FILE) or not (username and password):
+            username = password = None
+
+        if self.service is None:
+            # Playwright and the scraper are only loaded once a scrape starts
+            from scraper_service import ScraperService
+            self.service = ScraperService(captcha_handler=self.solve_captcha)
+        future = self.service.submit(keyword, max_pages, username, password)
+        future.add_done_callback(
+            lambda f: self.root.after(0, self.scraping_finished, keyword, f)
         )
-        scraping_thread.start()
 
-    def scrape_products(self, keyword, username=None, password=None):
+    def scraping_finished(self, keyword, future):
         try:
-            try:
-                max_pages = int(self.page_var.get())
-            except ValueError:
-                max_pages = 3
-
-            scraper = LazadaScraper(self.root)
-        
-            if not os.path.exists(LAZADA_COOKIE_FILE) and username and password:
-                results = scraper.scrape(keyword, username, password, max_pages)
-            else:
-                results = scraper.scrape(keyword, max_pages=max_pages)
-            
-            self.update_gui(results)
+            future.result()
             self.keyword = keyword
             self.refresh_table_list()
-            self.table_var.set(keyword)
+            self.select_keyword(keyword)
             self.load_selected_table()
 
         except Exception as e:
@@ -191,42 +257,274 @@ class LazadaGUI:
             self.scraping_in_progress = False
             self.search_entry.config(state="normal")
 
-    def update_gui(self, products):
-        for row in self.tree.get_children():
-            self.tree.delete(row)
-
-        for product in products:
-            self.tree.insert('', 'end', values=(product['name'], product['price'], product['sold'], product['link']))
-
-    def refresh_data(self):
-        if not hasattr(self, 'keyword') or not self.keyword:
+    def solve_captcha(self, page):
+        """CAPTCHA handler run on the scraper thread: show the popup on the Tk thread and wait for OK"""
+        closed = threading.Event()
+        self.root.after(0, self._show_captcha_dialog, closed)
+        closed.wait()
+        return True
+
+    def _show_captcha_dialog(self, closed):
+        captcha_window = tk.Toplevel(self.root)
+        captcha_window.title("CAPTCHA Required")
+
+        window_width = 300
+        window_height = 120
+        screen_width = captcha_window.winfo_screenwidth()
+        screen_height = captcha_window.winfo_screenheight()
+        x = int((screen_width/2) - (window_width/2))
+        y = int((screen_height/2) - (window_height/2))
+        captcha_window.geometry(f"{window_width}x{window_height}+{x}+{y}")
+
+        message = ("CAPTCHA detected!\n\n"
+                "Please solve it manually in the browser window,\n"
+                "then click OK to continue.")
+        tk.Label(captcha_window, text=message, padx=20, pady=10).pack()
+
+        ok_button = tk.Button(captcha_window, text="OK", command=captcha_window.destroy)
+        ok_button.pack(pady=10)
+
+        # Closing the popup any way (or the main window) lets the scraper carry on
+        captcha_window.bind("<Destroy>", lambda event: closed.set())
+        captcha_window.grab_set()
+
+    def on_close(self):
+        if self.service:
+            self.service.stop(wait=False)
+        self.root.destroy()
+
+    def on_tree_scroll(self, first, last):
+        """Map the table's view of its window onto the whole result set, moving the window near its edges"""
+        if not self.window_rows or not self.total_rows:
+            self.tree_scrollbar.set(first, last)
             return
-            
-        for row in self.tree.get_children():
-            self.tree.delete(row)
+        top = self.window_start + float(first) * self.window_rows
+        bottom = self.window_start + float(last) * self.window_rows
+        self.tree_scrollbar.set(top / self.total_rows, bottom / self.total_rows)
+        if not self.loading_rows and self._needs_window(top, bottom):
+            self.target_row = int(top)
+            self._load_window(self.target_row)
+
+    def on_scrollbar(self, *args):
+        if args[0] == "moveto":
+            self.show_row(int(float(args[1]) * self.total_rows))
+        else:
+            # Line and page steps scroll the window itself; on_tree_scroll moves it when needed
+            self.tree.yview(*args)
+
+    def _visible_rows(self):
+        first, last = self.tree.yview()
+        return max(1, int((last - first) * self.window_rows))
+
+    def _needs_window(self, top, bottom):
+        """Whether rows top to bottom are outside the window or in an edge chunk that has rows beyond it"""
+        end = self.window_end
+        return (top < self.window_start or bottom > end
+                or (self.window_start > 0 and top < self.window_start + LAZADA_GUI_CHUNK_ROWS)
+                or (end < self.total_rows and bottom > end - LAZADA_GUI_CHUNK_ROWS))
+
+    def _window_for(self, row):
+        """Chunk-aligned (start, end) rows of the window centred on row's chunk"""
+        chunk = row // LAZADA_GUI_CHUNK_ROWS
+        start = max(0, chunk - LAZADA_GUI_WINDOW_CHUNKS) * LAZADA_GUI_CHUNK_ROWS
+        end = min(self.total_rows, (chunk + LAZADA_GUI_WINDOW_CHUNKS + 1) * LAZADA_GUI_CHUNK_ROWS)
+        return start, end
+
+    def show_row(self, row):
+        """Scroll row to the top of the table, loading its window first if needed"""
+        self.target_row = max(0, min(row, self.total_rows - 1))
+        if self.loading_rows:
+            # Picked up once the window being loaded arrives
+            return
+        if self._needs_window(self.target_row, self.target_row + self._visible_rows()):
+            self._load_window(self.target_row)
+        else:
+            self._scroll_to_target()
+
+    def _scroll_to_target(self):
+        if self.window_rows:
+            self.tree.yview_moveto((self.target_row - self.window_start) / self.window_rows)
+
+    def _row_fetcher(self):
+        """(count, fetch) callables for the current view, safe to run off the Tk thread"""
+        search_text = self.filter_var.get().strip()
+        if search_text:
+            return (lambda: self.db.count_search_products(search_text),
+                    lambda offset: self.db.search_products(search_text, LAZADA_GUI_CHUNK_ROWS, offset))
+
+        keyword, sort_option = self.keyword, self.sort_option()
+        return (lambda: self.db.count_products([keyword]),
+                lambda offset: self.db.get_products(keyword, sort_option, limit=LAZADA_GUI_CHUNK_ROWS, offset=offset))
+
+    def _query_rows(self, generation, offsets, on_rows, count=False):
+        """Fetch the chunks at offsets (and the row count) on a worker thread, handing them to the Tk thread"""
+        count_rows, fetch = self.row_fetcher
+
+        def work():
+            total = count_rows() if count else None
+            chunks = {offset: fetch(offset) for offset in offsets}
+            self.root.after(0, on_rows, generation, total, chunks)
+
+        self.loading_rows = True
+        threading.Thread(target=work, daemon=True).start()
+
+    def _load_window(self, row):
+        start, end = self._window_for(row)
+        if (start, end) == (self.window_start, self.window_end):
+            return
+        missing = [offset for offset in range(start, end, LAZADA_GUI_CHUNK_ROWS) if offset not in self.window_chunks]
+        self._query_rows(self.query_generation, missing,
+                         lambda generation, total, chunks: self._show_window(generation, start, end, chunks))
+
+    def _row_ids(self, rows):
+        """Stable Treeview ids keyed by link, numbered when a link repeats"""
+        ids = []
+        for row in rows:
+            iid = row[3]
+            if iid in self.row_id_counts:
+                self.row_id_counts[iid] += 1
+                iid = f"{iid}#{self.row_id_counts[iid]}"
+            else:
+                self.row_id_counts[iid] = 0
+            ids.append(iid)
+        return ids
+
+    def update_gui(self, rows):
+        """Show rows, moving existing items instead of rebuilding them"""
+        self.row_id_counts = {}
+        ids = self._row_ids(rows)
+        wanted = set(ids)
+        stale = [iid for iid in self.tree.get_children() if iid not in wanted]
+        if stale:
+            self.tree.delete(*stale)
+
+        for index, (iid, row) in enumerate(zip(ids, rows)):
+            if self.tree.exists(iid):
+                if tuple(self.tree.item(iid, 'values')) != tuple(str(value) for value in row):
+                    self.tree.item(iid, values=row)
+                self.tree.move(iid, '', index)
+            else:
+                self.tree.insert('', index, iid=iid, values=row)
 
-        db = DatabaseManager(LAZADA_DB_NAME)
-        db.connect()
-        
-        sort_mapping = {
-            "default (original order)": "default",
-            "price (low to high)": "price_low_to_high",
-            "price (high to low)": "price_high_to_low",
-            "sold (high to low)": "sold_high_to_low",
-            "sold (low to high)": "sold_low_to_high"
+    def _show_first_rows(self, generation, total, chunks):
+        if generation != self.query_generation:
+            return
+        self.total_rows = total
+        self.window_chunks = {}
+        self.target_row = 0
+        start, end = self._window_for(0)
+        self._show_window(generation, start, end, chunks)
+
+    def _show_window(self, generation, start, end, chunks):
+        """Replace the table's rows with rows start to end, reusing the chunks already loaded"""
+        if generation != self.query_generation:
+            return
+        self.loading_rows = False
+        self.window_chunks = {
+            offset: chunks[offset] if offset in chunks else self.window_chunks[offset]
+            for offset in range(start, end, LAZADA_GUI_CHUNK_ROWS)
         }
-        
-        sort_option = sort_mapping.get(self.sort_variable.get(), "default")
-        
-        products = db.get_products(
-            f"products_{self.keyword.replace(' ', '_')}",
-            sort_option
+        rows = [row for chunk in self.window_chunks.values() for row in chunk]
+        self.update_gui(rows)
+        self.window_start, self.window_end = start, end
+        self.window_rows = len(rows)
+        self._scroll_to_target()
+        if self._needs_window(self.target_row, self.target_row + self._visible_rows()):
+            # The scrollbar was dragged elsewhere while this window loaded
+            self._load_window(self.target_row)
+
+    def export_results(self):
+        """Export what the table shows (every matching row, not just the loaded ones) in the background"""
+        search_text = self.filter_var.get().strip()
+        if not search_text and not self.keyword:
+            messagebox.showinfo("Export", "Select a saved search or find products first")
+            return
+        path = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV", "*.csv"), ("JSON Lines", "*.jsonl"), ("Parquet", "*.parquet")]
         )
+        if not path:
+            return
+
+        keyword = self.keyword
+        sort_option = self.sort_option()
+        self.export_button.config(state="disabled")
+
+        def progress(written, total):
+            self.root.after(0, self.export_button.config, {'text': f"Exporting {written:,} of {total:,} rows..."})
 
-        for product in products:
-            self.tree.insert('', 'end', values=product)
-            
-        db.close()
+        def work():
+            try:
+                if search_text:
+                    rows = export(path, progress=progress, search_text=search_text)
+                else:
+                    rows = export(path, keywords=[keyword], sort_option=sort_option, progress=progress)
+                self.root.after(0, messagebox.showinfo, "Export", f"Exported {rows:,} rows to {path}")
+            except (ImportError, ValueError, OSError, sqlite3.Error) as e:
+                self.root.after(0, messagebox.showerror, "Export failed", str(e))
+            finally:
+                self.root.after(0, self.export_button.config, {'text': "Export...", 'state': "normal"})
+
+        threading.Thread(target=work, daemon=True).start()
+
+    def _load_stats(self, generation, keyword):
+        """Fetch the stats header of keyword off the Tk thread"""
+        def work():
+            stats = self.db.get_price_stats(keyword)
+            drops = self.db.get_price_drops(keyword, LAZADA_PRICE_DROP_PERCENT)
+            self.root.after(0, self._show_stats, generation, stats, drops)
+
+        threading.Thread(target=work, daemon=True).start()
+
+    def _show_stats(self, generation, stats, drops):
+        if generation != self.query_generation:
+            return
+        if not stats or not stats[0]['priced_count']:
+            self.stats_var.set("")
+            return
+        stats = stats[0]
+
+        def peso(centavos):
+            return f"₱{centavos / 100:,.2f}"
+
+        text = (f"{stats['product_count']} products | {peso(stats['min'])} - {peso(stats['max'])} | "
+                f"median {peso(stats['median'])} (25% {peso(stats['p25'])}, 75% {peso(stats['p75'])})")
+        if drops:
+            text += f" | {len(drops)} dropped over {LAZADA_PRICE_DROP_PERCENT}% since the last scrape"
+        self.stats_var.set(text)
+
+    def sort_option(self):
+        return SORT_MAPPING.get(self.sort_variable.get(), "default")
+
+    def clear_filter(self):
+        self.filter_var.set("")
+        self.refresh_data()
+
+    def refresh_data(self):
+        searching = bool(self.filter_var.get().strip())
+        if not searching and not self.keyword:
+            # Nothing to show, e.g. search results cleared before any saved search was opened
+            self.query_generation += 1
+            self.tree.delete(*self.tree.get_children())
+            self.tree['displaycolumns'] = ('Name', 'Price', 'Sold', 'Link')
+            self.total_rows = self.window_start = self.window_end = self.window_rows = 0
+            self.window_chunks = {}
+            self.loading_rows = False
+            return
+
+        if searching:
+            self.tree['displaycolumns'] = ('Name', 'Price', 'Sold', 'Link', 'Keyword')
+        else:
+            self.tree['displaycolumns'] = ('Name', 'Price', 'Sold', 'Link')
+
+        self.query_generation += 1
+        self.stats_var.set("")
+        if not searching:
+            self._load_stats(self.query_generation, self.keyword)
+        self.row_fetcher = self._row_fetcher()
+        # The row count is not known yet: fetch the first window as if it were full
+        first_window = range(0, (LAZADA_GUI_WINDOW_CHUNKS + 1) * LAZADA_GUI_CHUNK_ROWS, LAZADA_GUI_CHUNK_ROWS)
+        self._query_rows(self.query_generation, first_window, self._show_first_rows, count=True)
 
 if __name__ == "__main__":
     root = tk.Tk()
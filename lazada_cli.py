@@ -0,0 +1,143 @@
+"""Headless batch scraping for scheduled runs, no display or tkinter needed.
+
+    python -m lazada_cli keywords.txt --pages 3
+    python -m lazada_cli keywords.txt --jsonl --no-db > products.jsonl
+    python -m lazada_cli keywords.txt --processes 8
+    python -m lazada_cli keywords.txt --record session.json
+    python -m lazada_cli keywords.txt --replay session.json --replay-latency 200 --concurrency 4
+
+The keyword file has one keyword per line ("-" reads stdin); blank lines
+and lines starting with # are ignored. Progress goes to stderr so stdout
+carries only JSONL. CAPTCHAs are skipped and counted, never waited on. --record saves the
+session and --replay serves it again offline (see replay.py), which makes
+whole-pipeline timings repeatable.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import sys
+import metrics
+from lazada_scraper import LazadaScraper, skip_captcha
+from replay import Recorder, Replayer
+
+
+def read_keywords(path):
+    if path == "-":
+        lines = sys.stdin.read().splitlines()
+    else:
+        with open(path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    keywords = (line.strip() for line in lines)
+    return list(dict.fromkeys(k for k in keywords if k and not k.startswith("#")))
+
+
+def record_replay(args):
+    """The (recorder, replayer) pair the scrapers use, either may be None"""
+    recorder = Recorder(args.record) if args.record else None
+    replayer = Replayer(args.replay, args.replay_latency / 1000) if args.replay else None
+    return recorder, replayer
+
+
+def run_sequential(keywords, args, emit):
+    scraper = LazadaScraper(skip_captcha, headless=not args.headed, channel=args.channel)
+    scraper.save_to_db = not args.no_db
+    scraper.recorder, scraper.replayer = record_replay(args)
+    scraper.start()
+    try:
+        for keyword in keywords:
+            emit(keyword, scraper.search_and_scrape(keyword, args.pages))
+    finally:
+        scraper.stop()
+    return scraper.captcha_hits
+
+
+def run_concurrent(keywords, args, emit):
+    from async_scraper import AsyncLazadaScraper
+
+    scraper = AsyncLazadaScraper(concurrency=args.concurrency, headless=not args.headed,
+                                 channel=args.channel, save_to_db=not args.no_db)
+    scraper.recorder, scraper.replayer = record_replay(args)
+    results = asyncio.run(scraper.scrape_many(keywords, args.pages))
+    for keyword in keywords:
+        emit(keyword, results[keyword])
+    return scraper.captcha_hits
+
+
+def run_sharded(keywords, args, emit):
+    from sharded_scraper import ShardCoordinator
+
+    coordinator = ShardCoordinator(processes=args.processes, headless=not args.headed, channel=args.channel,
+                                   save_to_db=not args.no_db, collect=True)
+    results = coordinator.run(keywords, args.pages)
+    for keyword in keywords:
+        emit(keyword, results.get(keyword, []))
+    return coordinator.captcha_hits()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m lazada_cli", description="Scrape Lazada search results headlessly")
+    parser.add_argument("keywords_file", help="file with one keyword per line, - for stdin")
+    parser.add_argument("--pages", type=int, default=3, help="result pages per keyword (default 3)")
+    parser.add_argument("--jsonl", action="store_true", help="stream products to stdout as JSON lines")
+    parser.add_argument("--no-db", action="store_true", help="do not write results to the database")
+    parser.add_argument("--concurrency", type=int, default=1, help="keywords scraped at once (default 1)")
+    parser.add_argument("--processes", type=int, default=1,
+                        help="worker processes with their own browser, one database writer (default 1)")
+    parser.add_argument("--headed", action="store_true", help="show the browser window")
+    parser.add_argument("--channel", default=None, help="browser channel, e.g. msedge (default: bundled Chromium)")
+    session = parser.add_mutually_exclusive_group()
+    session.add_argument("--record", metavar="PATH", help="save every page and listing response to PATH")
+    session.add_argument("--replay", metavar="PATH", help="serve responses from a recording or HAR file instead of Lazada")
+    parser.add_argument("--replay-latency", type=float, default=0, metavar="MS",
+                        help="delay added to each replayed page and listing response")
+    parser.add_argument("--metrics-json", metavar="PATH", help="write a JSON summary of phase timings and counters")
+    parser.add_argument("--metrics-prom", metavar="PATH", help="write the same metrics as a Prometheus textfile")
+    args = parser.parse_args(argv)
+
+    if args.no_db and not args.jsonl:
+        parser.error("--no-db without --jsonl would discard all results")
+
+    keywords = read_keywords(args.keywords_file)
+    if not keywords:
+        parser.error("no keywords to scrape")
+
+    run_metrics = metrics.get_metrics()
+    if args.metrics_json or args.metrics_prom:
+        run_metrics = metrics.enable()
+
+    out = sys.stdout
+    totals = {}
+
+    def emit(keyword, products):
+        totals[keyword] = len(products)
+        if args.jsonl:
+            for product in products:
+                out.write(json.dumps({'keyword': keyword, **product}, ensure_ascii=False) + "\n")
+            out.flush()
+
+    if args.processes > 1 and (args.concurrency > 1 or args.record or args.replay):
+        parser.error("--processes cannot be combined with --concurrency, --record or --replay")
+
+    with contextlib.redirect_stdout(sys.stderr):
+        if args.processes > 1:
+            captcha_hits = run_sharded(keywords, args, emit)
+        elif args.concurrency > 1:
+            captcha_hits = run_concurrent(keywords, args, emit)
+        else:
+            captcha_hits = run_sequential(keywords, args, emit)
+
+    empty = [keyword for keyword, count in totals.items() if not count]
+    print(f"Scraped {sum(totals.values())} products for {len(keywords)} keywords, "
+          f"{len(empty)} empty, {captcha_hits} CAPTCHAs skipped", file=sys.stderr)
+    for keyword in empty:
+        print(f"  no products: {keyword}", file=sys.stderr)
+    if args.metrics_json or args.metrics_prom:
+        run_metrics.export(args.metrics_json, args.metrics_prom)
+    else:
+        run_metrics.export()
+    return 0 if sum(totals.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,77 +2,201 @@ import os
 import random
 import time
 import json
-import threading
-import tkinter as tk
+from urllib.parse import urlencode
 from playwright.sync_api import sync_playwright
-from bs4 import BeautifulSoup
-from config import LAZADA_COOKIE_FILE, LAZADA_DB_NAME
+from card_parser import CARD_CLASS, parse_cards, parse_listing_json, unique_products
+from config import (LAZADA_COOKIE_FILE, LAZADA_DB_NAME, LAZADA_PARSER_BACKEND, LAZADA_HTML_DUMP_DIR,
+                    LAZADA_LISTING_JSON, LAZADA_BLOCK_RESOURCES, LAZADA_BLOCKED_RESOURCE_TYPES,
+                    LAZADA_RESOURCE_ALLOWLIST, LAZADA_SCROLL_MAX, LAZADA_SCROLL_BUDGET,
+                    LAZADA_SCROLL_STABLE_ROUNDS, LAZADA_SCROLL_IDLE, LAZADA_HEADLESS,
+                    LAZADA_BROWSER_CHANNEL)
 from database import DatabaseManager
+from lazy_load import NetworkTracker, ScrollTracker
+from metrics import get_metrics, timed
+from pacer import get_pacer, throttled
+from resource_policy import ResourcePolicy
+
+BASE_URL = "https://www.lazada.com.ph"
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+LOCALE = "en-US,en;q=0.9"
+SCROLL_POLL_MS = 250
+NEXT_PAGE_NAV = 'div.e5J1n li.ant-pagination-next'
+NEXT_PAGE_BUTTON = 'button.ant-pagination-item-link'
+
+
+def search_url(keyword, page=None, ajax=False):
+    """Search results for keyword sorted by Top Sales, optionally a specific result page.
+
+    With ajax=True the URL returns the listing as JSON instead of HTML.
+    """
+    params = {'q': keyword, 'sort': 'popularity'}
+    if page and page > 1:
+        params['page'] = page
+    if ajax:
+        params['ajax'] = 'true'
+    return f"{BASE_URL}/catalog/?{urlencode(params)}"
+
+
+def resource_policy():
+    """The configured ResourcePolicy, or None when resource blocking is off"""
+    if not LAZADA_BLOCK_RESOURCES:
+        return None
+    return ResourcePolicy(blocked_types=LAZADA_BLOCKED_RESOURCE_TYPES, allowlist=LAZADA_RESOURCE_ALLOWLIST)
+
+
+def scroll_tracker():
+    return ScrollTracker(LAZADA_SCROLL_MAX, LAZADA_SCROLL_BUDGET, LAZADA_SCROLL_STABLE_ROUNDS, LAZADA_SCROLL_IDLE)
+
+
+def skip_captcha(page):
+    """Non-interactive CAPTCHA handler: report it and carry on without solving"""
+    print(f"CAPTCHA detected at {page.url}, skipping")
+    return False
+
+
+class CaptchaSkipped(Exception):
+    """A result page showed a CAPTCHA that was not solved"""
+
+
+# Per-page steps shared by LazadaScraper and AsyncLazadaScraper; only the
+# browser calls around them differ between the two
+
+def parse_page(html, backend=LAZADA_PARSER_BACKEND):
+    """(products, captcha) of a rendered result page; captcha is True when it shows a CAPTCHA instead of cards"""
+    with get_metrics().span("parse"):
+        products = parse_cards(html, backend)
+    return products, not products and "captcha" in html.lower()
+
+
+def record_scroll(tracker):
+    """Add a settled page's scroll count and settle time to the run metrics, returns tracker.metrics()"""
+    scroll = tracker.metrics()
+    metrics = get_metrics()
+    metrics.observe("scrolls_per_page", scroll['scrolls'])
+    metrics.observe("scroll_settle_seconds", scroll['settle_seconds'])
+    if scroll['hit_budget']:
+        metrics.inc("scroll_budget_hits")
+    return scroll
+
+
+def count_page(products):
+    get_metrics().inc("pages")
+    get_metrics().observe("products_per_page", len(products))
+
+
+def add_page(products, page_products, seen):
+    """Count a scraped page and add the products not seen earlier in the search"""
+    count_page(page_products)
+    products.extend(unique_products(page_products, seen))
+
+
+def record_captcha(scraper, url):
+    """Count a CAPTCHA on scraper and make its pacer back off from url's host, unless replaying"""
+    scraper.captcha_hits += 1
+    get_metrics().inc("captcha_hits")
+    if not scraper.replayer:
+        scraper.pacer.penalize(url, "captcha")
+
+
+def is_last_page(button_class):
+    """Whether the next-page button, by its class attribute, is disabled"""
+    return 'ant-pagination-disabled' in (button_class or '')
+
+
+def mouse_moves(box):
+    """(x, y, steps, pause) moves that approach a point inside box from a little off target"""
+    x = box['x'] + box['width'] * random.uniform(0.3, 0.7)
+    y = box['y'] + box['height'] * random.uniform(0.3, 0.7)
+    return [
+        (x + random.randint(-50, 50), y + random.randint(-50, 50), random.randint(3, 10), random.uniform(0.2, 0.5)),
+        (x, y, random.randint(2, 5), random.uniform(0.1, 0.3)),
+    ]
+
+
+def launch_options(user_agent=USER_AGENT, locale=LOCALE, headless=LAZADA_HEADLESS, channel=LAZADA_BROWSER_CHANNEL):
+    """Keyword arguments for chromium.launch shared by the sync and async scrapers"""
+    return dict(
+        headless=headless,
+        args=[
+            f'--user-agent={user_agent}',
+            '--no-sandbox',
+            '--disable-dev-shm-usage',
+            '--disable-blink-features=AutomationControlled',
+            f'--lang={locale.split(",")[0]}',
+            '--start-maximized'
+        ],
+        channel=channel,
+        chromium_sandbox=False,
+        ignore_default_args=["--enable-automation"]
+    )
+
 
 class LazadaScraper:
-    def __init__(self, root):
-        self.root = root
+    def __init__(self, captcha_handler=skip_captcha, headless=LAZADA_HEADLESS, channel=LAZADA_BROWSER_CHANNEL):
+        self.captcha_handler = captcha_handler
+        self.headless = headless
+        self.channel = channel
         self.wait_time = 25
-        self.user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+        self.user_agent = USER_AGENT
         self.playwright = None
         self.browser = None
+        self.context = None
         self.page = None
-        self.locale = "en-US,en;q=0.9"
+        self.locale = LOCALE
         self.cookie_file = LAZADA_COOKIE_FILE
         self.db_name = LAZADA_DB_NAME
+        self.parser_backend = LAZADA_PARSER_BACKEND
+        self.html_dump_dir = LAZADA_HTML_DUMP_DIR
+        self.use_listing_json = LAZADA_LISTING_JSON
+        self.resource_policy = resource_policy()
+        self.network = None
+        self.save_to_db = True
+        self.captcha_hits = 0
+        self.captcha_skipped = 0
+        self.last_error = None
+        self.pacer = get_pacer()
+        # replay.Recorder / replay.Replayer, set before start()
+        self.recorder = None
+        self.replayer = None
 
     def _human_like_delay(self, min_sec=1, max_sec=4):
+        if self.replayer:
+            # Nobody to fool in a replay, keep runs deterministic
+            return
         time.sleep(random.uniform(min_sec, max_sec))
 
+    def _paced(self, url):
+        """Pacer slot for a request to url; replays are not held back"""
+        return self.pacer.request(url, wait=not self.replayer)
+
+    def _goto(self, url):
+        with self._paced(url) as ticket, get_metrics().span("page_load"):
+            response = self.page.goto(url, timeout=60000)
+            if response is not None and throttled(response.status):
+                ticket.fail()
+        return response
+
     def _typing_delay(self):
         time.sleep(random.uniform(0.05, 0.3))
 
     def _move_mouse_naturally(self, element):
-        box = element.bounding_box()
-        x = box['x'] + box['width'] * random.uniform(0.3, 0.7)
-        y = box['y'] + box['height'] * random.uniform(0.3, 0.7)
-        
-        self.page.mouse.move(
-            x + random.randint(-50, 50),
-            y + random.randint(-50, 50),
-            steps=random.randint(3, 10)
-        )
-        self._human_like_delay(0.2, 0.5)
-        self.page.mouse.move(x, y, steps=random.randint(2, 5))
-        self._human_like_delay(0.1, 0.3)
-
-    def _handle_captcha_manually(self):
-        """Handle CAPTCHA with GUI popup instead of console input"""
-        if "captcha" in self.page.content().lower():
-            captcha_window = tk.Toplevel()
-            captcha_window.title("CAPTCHA Required")
-            
-            window_width = 300
-            window_height = 120
-            screen_width = captcha_window.winfo_screenwidth()
-            screen_height = captcha_window.winfo_screenheight()
-            x = int((screen_width/2) - (window_width/2))
-            y = int((screen_height/2) - (window_height/2))
-            captcha_window.geometry(f"{window_width}x{window_height}+{x}+{y}")
-            
-            message = ("CAPTCHA detected!\n\n"
-                    "Please solve it manually in the browser window,\n"
-                    "then click OK to continue.")
-            tk.Label(captcha_window, text=message, padx=20, pady=10).pack()
-            
-            captcha_solved = threading.Event()
-            
-            def on_ok_click():
-                captcha_solved.set()
-                captcha_window.destroy()
-            
-            ok_button = tk.Button(captcha_window, text="OK", command=on_ok_click)
-            ok_button.pack(pady=10)
-            
-            captcha_window.grab_set()
-            self.root.wait_window(captcha_window)
-            return True
-        return False
+        for x, y, steps, pause in mouse_moves(element.bounding_box()):
+            self.page.mouse.move(x, y, steps=steps)
+            self._human_like_delay(pause, pause)
+
+    def _solve_captcha(self):
+        """Pass the CAPTCHA on the current page to captcha_handler, returns whether it was solved"""
+        record_captcha(self, self.page.url)
+        solved = bool(self.captcha_handler(self.page))
+        if not solved:
+            self.captcha_skipped += 1
+        return solved
+
+    def _handle_captcha(self):
+        """_solve_captcha if the current page shows a CAPTCHA, otherwise None"""
+        if "captcha" not in self.page.content().lower():
+            return None
+        return self._solve_captcha()
 
     def _save_cookies(self):
         cookies = self.page.context.cookies()
@@ -91,6 +215,12 @@ class LazadaScraper:
         print(f"Cookies loaded from: {self.cookie_file}")
         return True
 
+    def _dump_html(self, html, keyword, page_number):
+        os.makedirs(self.html_dump_dir, exist_ok=True)
+        file_name = f"{keyword.replace(' ', '_')}_page{page_number}.html"
+        with open(os.path.join(self.html_dump_dir, file_name), 'w', encoding='utf-8') as f:
+            f.write(html)
+
     def _is_logged_in(self):
         try:
             self.page.wait_for_selector('div.account-user-name', timeout=5000)
@@ -110,12 +240,12 @@ class LazadaScraper:
             print(f"Error deleting cookies: {e}")
             return False
         
+    @timed("login")
     def login(self, username=None, password=None):
         try:
             if self._load_cookies():
                 print("Attempting to use saved cookies...")
-                self.page.goto("https://www.lazada.com.ph", timeout=60000)
-                self._human_like_delay(2, 4)
+                self._goto(BASE_URL)
                 
                 if self._is_logged_in():
                     print("Logged in successfully with cookies")
@@ -123,8 +253,7 @@ class LazadaScraper:
 
             if username and password:
                 print("Loading login page...")
-                self.page.goto("https://www.lazada.com.ph/customer/account/login/", timeout=60000)
-                self._human_like_delay(2, 4)
+                self._goto(f"{BASE_URL}/customer/account/login/")
 
                 print("Entering username...")
                 username_field = self.page.wait_for_selector(
@@ -168,9 +297,8 @@ class LazadaScraper:
                 )
                 login_btn.click()
 
-                if self._handle_captcha_manually():
+                if self._handle_captcha():
                     print("Continuing after CAPTCHA...")
-                    self._human_like_delay(5, 8)
 
                 if self._is_logged_in():
                     self._save_cookies()
@@ -183,164 +311,237 @@ class LazadaScraper:
             print("Login failed:", str(e))
             return False
 
+    def _save(self, keyword, products):
+        if not self.save_to_db:
+            return
+        with get_metrics().span("db_write"):
+            DatabaseManager(self.db_name).insert_products(keyword, products)
+
+    @timed("scroll")
+    def _scroll_until_loaded(self, keyword, page_number):
+        """Scroll until no more cards appear and listing requests are idle"""
+        cards = self.page.locator(f"div.{CARD_CLASS}")
+        tracker = scroll_tracker()
+        tracker.begin(cards.count())
+
+        done = False
+        while not done:
+            self.page.mouse.wheel(0, random.randint(500, 1000))
+            self.page.wait_for_timeout(SCROLL_POLL_MS)
+            while not tracker.scroll_settled(cards.count(), self.network):
+                self.page.wait_for_timeout(SCROLL_POLL_MS)
+            done = tracker.record_scroll(cards.count())
+
+        metrics = record_scroll(tracker)
+        print(f"Page {page_number} settled after {metrics['scrolls']} scrolls "
+              f"in {metrics['settle_seconds']:.1f}s with {metrics['cards']} cards")
+        return metrics
+
+    def _request_text(self, url):
+        """(status, body) of a GET through the page's request context, or from the replay"""
+        if self.replayer:
+            return self.replayer.fetch(url)
+        response = self.page.request.get(url, timeout=60000)
+        text = response.text()
+        if self.recorder:
+            self.recorder.add(url, response.status, response.headers, text)
+        return response.status, text
+
+    def _fetch_listing_json(self, keyword, page_number):
+        metrics = get_metrics()
+        url = search_url(keyword, page_number, ajax=True)
+        try:
+            with self._paced(url) as ticket, metrics.span("page_load"):
+                status, text = self._request_text(url)
+                if throttled(status):
+                    ticket.fail()
+            if not 200 <= status < 300:
+                return None
+            with metrics.span("parse"):
+                return parse_listing_json(text)
+        except Exception as e:
+            print(f"Listing request failed: {e}")
+            return None
+
+    def _scrape_listing_json(self, keyword, max_pages):
+        """Products from the ajax listing endpoint, None if it did not return a listing"""
+        products = []
+        seen = set()
+        for current_page in range(1, max_pages + 1):
+            page_products = self._fetch_listing_json(keyword, current_page)
+            if page_products is None:
+                if current_page == 1:
+                    return None
+                print(f"Listing unavailable for page {current_page}, stopping")
+                break
+            if not page_products:
+                print("No more pages available")
+                break
+            add_page(products, page_products, seen)
+            print(f"Successfully scraped {len(products)} products on page {current_page}.")
+        return products
+
+    @timed("search")
     def search_and_scrape(self, keyword, max_pages):
+        metrics = get_metrics()
+        self.last_error = None
         try:
-            self._human_like_delay(3, 5)
-
-            db = DatabaseManager(self.db_name)
-            table_name = f"products_{keyword.replace(' ', '_')}"
-            
-            db.cursor.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name='{table_name}'")
-            if db.cursor.fetchone():
-                db.clear_table(table_name)
-                db.create_table(keyword)
-            else:
-                db.create_table(keyword)
+            if self.use_listing_json:
+                print(f"Fetching listing data for '{keyword}'...")
+                products = self._scrape_listing_json(keyword, max_pages)
+                if products is not None:
+                    print(f"\nTotal products scraped from listing data: {len(products)}")
+                    self._save(keyword, products)
+                    return products
+                print("No listing data returned, falling back to the page markup")
 
             print(f"Searching for '{keyword}'...")
-            search_box = self.page.wait_for_selector(
-                "input.search-box__input--O34g",
-                timeout=self.wait_time * 1000
-            )
-            self._move_mouse_naturally(search_box)
-            search_box.click()
-            self._human_like_delay(0.5, 1.2)
-            search_box.fill("")
-
-            for char in keyword:
-                search_box.press(char)
-                self._typing_delay()
-                if random.random() < 0.1:
-                    self._human_like_delay(0.5, 1.5)
-
-            print("Submitting search...")
-            search_btn = self.page.wait_for_selector(
-                "a.search-box__button--1oH7",
-                timeout=10000
-            )
-            search_btn.click()
-            self._human_like_delay(3, 6)
-
-            print("Sorting by Top Sales...")
-            
-            current_url = self.page.url + "&sort=popularity"
-            self.page.goto(current_url, timeout=60000)
+            self._goto(search_url(keyword))
 
             products = []
+            seen = set()
             current_page = 1
+            captcha_skipped = False
 
             while current_page <= max_pages:
                 print(f"\nProcessing page {current_page}...")
 
-                print(f"Loading more products... on page {current_page}")
-                for _ in range(6):
-                    self.page.mouse.wheel(0, random.randint(500, 1000))
-                    self._human_like_delay(1.5, 3)
-                
-                print(f"Scraping product information on page {current_page}...")
-                soup = BeautifulSoup(self.page.content(), 'html.parser')
-
-                for card in soup.select('div.Bm3ON'):
-                    try:
-                        name_tag = card.select_one('div.Ms6aG div.qmXQo div.buTCk a')
-                        if name_tag:
-                            name = name_tag.get_text(strip=True)
-                            link = name_tag['href'].split('?')[0]
-                        else:
-                            name = "No name found"
-                            link = "#"
-
-                        price = card.select_one('span.ooOxS').get_text(strip=True)
-
-                        sold_span = card.select_one('span._1cEkb > span')
-                        sold = sold_span.get_text(strip=True) if sold_span else "0 sold"
-                        
-                        products.append({
-                            'name': name,
-                            'price': price,
-                            'sold': sold,
-                            'link': link
-                        })
-
-                    except Exception as e:
-                        print(f"Error scraping product: {e}")
-                        continue
+                # A loaded page carries its own window.pageData, no scrolling needed
+                page_products = None
+                if self.use_listing_json:
+                    html = self.page.content()
+                    with metrics.span("parse"):
+                        page_products = parse_listing_json(html)
+
+                if page_products is None:
+                    print(f"Loading more products... on page {current_page}")
+                    self._scroll_until_loaded(keyword, current_page)
+
+                    print(f"Scraping product information on page {current_page}...")
+                    html = self.page.content()
+                    page_products, captcha = parse_page(html, self.parser_backend)
+                    if captcha:
+                        if not self._solve_captcha():
+                            print("Skipping the rest of this search")
+                            captcha_skipped = True
+                            break
+                        self._scroll_until_loaded(keyword, current_page)
+                        html = self.page.content()
+                        page_products, _ = parse_page(html, self.parser_backend)
+                if self.html_dump_dir:
+                    self._dump_html(html, keyword, current_page)
+                if not page_products:
+                    print(f"Page {current_page} is empty, stopping")
+                    break
+                add_page(products, page_products, seen)
 
                 print(f"Successfully scraped {len(products)} products on page {current_page}.")
 
-                nav = self.page.wait_for_selector('div.e5J1n li.ant-pagination-next', timeout=3000)
+                nav = self.page.wait_for_selector(NEXT_PAGE_NAV, timeout=3000)
 
-                next_page_btn = nav.wait_for_selector('button.ant-pagination-item-link', timeout=3000)
-                if 'ant-pagination-disabled' in next_page_btn.get_attribute('class'):
+                next_page_btn = nav.wait_for_selector(NEXT_PAGE_BUTTON, timeout=3000)
+                if is_last_page(next_page_btn.get_attribute('class')):
                     print("No more pages available")
                     break
-                    
+
                 print("Moving to next page...")
                 self._move_mouse_naturally(next_page_btn)
-                next_page_btn.click()
-                self._human_like_delay(2, 4)
+                with self._paced(self.page.url), metrics.span("page_load"):
+                    next_page_btn.click()
+                    self.page.wait_for_load_state("domcontentloaded")
                 current_page += 1
 
             print(f"\nTotal products scraped from {current_page - 1} pages: {len(products)}")
-            
-            db = DatabaseManager(self.db_name)
-            for product in products:
-                db.insert_product(table_name, product)
 
-            db.close()
+            if captcha_skipped and not products:
+                # Saving it would replace the keyword's listing with an empty one
+                self.last_error = "CAPTCHA not solved"
+                return []
+            self._save(keyword, products)
             return products
 
         except Exception as e:
             print(f"Search and scrape failed: {str(e)}")
+            metrics.inc("search_errors")
+            self.last_error = str(e)
             return []
 
+    def start(self):
+        """Launch Playwright and the browser and open a fresh context"""
+        self.playwright = sync_playwright().start()
+        self.browser = self.playwright.chromium.launch(
+            **launch_options(self.user_agent, self.locale, self.headless, self.channel)
+        )
+        self.new_context()
+
+    def new_context(self):
+        """Replace the current browser context, keeping the browser running"""
+        if self.context:
+            self.context.close()
+        self.context = self.browser.new_context()
+        self.page = self.context.new_page()
+        self.network = NetworkTracker()
+        self.network.attach(self.page)
+        if self.resource_policy:
+            self.resource_policy.install(self.page)
+        if self.recorder:
+            self.recorder.attach(self.page)
+        if self.replayer:
+            # Registered last so it answers before the resource policy sees anything
+            self.replayer.install(self.page)
+
+    def stop(self):
+        for closeable in (self.context, self.browser):
+            try:
+                if closeable:
+                    closeable.close()
+            except Exception as e:
+                print(f"Error closing browser: {e}")
+        if self.playwright:
+            self.playwright.stop()
+        self.playwright = self.browser = self.context = self.page = None
+        if self.recorder:
+            self.recorder.save()
+        if self.replayer:
+            print(self.replayer.summary())
+        if self.pacer.buckets:
+            print(self.pacer.summary())
+
     def scrape(self, keyword, username=None, password=None, max_pages=3):
         try:
-            with sync_playwright() as playwright:
-                self.playwright = playwright
-                self.browser = playwright.chromium.launch(
-                    headless=False,
-                    args=[
-                        f'--user-agent={self.user_agent}',
-                        '--no-sandbox',
-                        '--disable-dev-shm-usage',
-                        '--disable-blink-features=AutomationControlled',
-                        f'--lang={self.locale.split(",")[0]}',
-                        '--start-maximized'
-                    ],
-                    channel="msedge",
-                    chromium_sandbox=False,
-                    ignore_default_args=["--enable-automation"]
-                )
-                self.page = self.browser.new_page()
-                print("\nStarting Lazada scraping process...")
-
-                self.page.goto("https://www.lazada.com.ph", timeout=60000)
-                self._human_like_delay(2, 4)
-
-                # if self._load_cookies():
-                #     self.page.goto("https://www.lazada.com.ph", timeout=60000)
-                #     self._human_like_delay(2, 4)
-                    
-                #     if not self._is_logged_in() and username and password:
-                #         if not self.login(username, password):
-                #             print("\n[ERROR] Login failed. Exiting.")
-                #             return []
-                
-                # elif username and password:
-                #     if not self.login(username, password):
-                #         print("\n[ERROR] Login failed. Exiting.")
-                #         return []
-                
-                # else:
-                #     self.page.goto("https://www.lazada.com.ph", timeout=60000)
-                #     if not self._is_logged_in():
-                #         print("\n[INFO] Not logged in and no credentials provided")
-                #         return []
+            self.start()
+            print("\nStarting Lazada scraping process...")
+
+            self._goto(BASE_URL)
+
+            # if self._load_cookies():
+            #     self.page.goto("https://www.lazada.com.ph", timeout=60000)
+            #     self._human_like_delay(2, 4)
                 
-                products = self.search_and_scrape(keyword, max_pages)
-                return products
+            #     if not self._is_logged_in() and username and password:
+            #         if not self.login(username, password):
+            #             print("\n[ERROR] Login failed. Exiting.")
+            #             return []
+            
+            # elif username and password:
+            #     if not self.login(username, password):
+            #         print("\n[ERROR] Login failed. Exiting.")
+            #         return []
+            
+            # else:
+            #     self.page.goto("https://www.lazada.com.ph", timeout=60000)
+            #     if not self._is_logged_in():
+            #         print("\n[INFO] Not logged in and no credentials provided")
+            #         return []
+            
+            products = self.search_and_scrape(keyword, max_pages)
+            if self.resource_policy:
+                print(self.resource_policy.summary())
+            return products
 
         except Exception as e:
             print("\n[FATAL ERROR]", e)
-            return []
\ No newline at end of file
+            return []
+        finally:
+            self.stop()
+            get_metrics().export()
@@ -0,0 +1,87 @@
+"""Adaptive scrolling for lazily loaded search results.
+
+Instead of a fixed number of scrolls with random sleeps, the scrapers
+scroll until the card count stops growing and listing requests have gone
+quiet, within a maximum number of scrolls and a time budget. NetworkTracker
+and ScrollTracker hold the shared bookkeeping; the sync and async scrapers
+drive them with their own Playwright calls.
+"""
+import time
+
+LISTING_RESOURCE_TYPES = ("xhr", "fetch")
+
+
+class NetworkTracker:
+    """Counts in-flight xhr/fetch requests of a page"""
+
+    def __init__(self):
+        self.inflight = 0
+        self.last_activity = time.monotonic()
+
+    def _on_request(self, request):
+        if request.resource_type in LISTING_RESOURCE_TYPES:
+            self.inflight += 1
+            self.last_activity = time.monotonic()
+
+    def _on_done(self, request):
+        if request.resource_type in LISTING_RESOURCE_TYPES:
+            self.inflight = max(0, self.inflight - 1)
+            self.last_activity = time.monotonic()
+
+    def attach(self, page):
+        page.on("request", self._on_request)
+        page.on("requestfinished", self._on_done)
+        page.on("requestfailed", self._on_done)
+
+    def idle_for(self):
+        """Seconds since the last listing request finished, 0 while any is in flight"""
+        if self.inflight:
+            return 0
+        return time.monotonic() - self.last_activity
+
+
+class ScrollTracker:
+    """Decides when a page has settled and records what it took"""
+
+    def __init__(self, max_scrolls, budget, stable_rounds, idle_time):
+        self.max_scrolls = max_scrolls
+        self.budget = budget
+        self.stable_rounds = stable_rounds
+        self.idle_time = idle_time
+        self.started = None
+        self.scrolls = 0
+        self.stable = 0
+        self.cards = 0
+        self.initial_cards = 0
+
+    def begin(self, cards):
+        self.started = time.monotonic()
+        self.cards = self.initial_cards = cards
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def scroll_settled(self, cards, network):
+        """True once the scroll just made has produced new cards or the network is quiet"""
+        return cards > self.cards or network.idle_for() >= self.idle_time or self.elapsed() >= self.budget
+
+    def record_scroll(self, cards):
+        """Account for one scroll, returns True when scrolling should stop"""
+        self.scrolls += 1
+        if cards > self.cards:
+            self.stable = 0
+        else:
+            self.stable += 1
+        self.cards = cards
+        return (self.stable >= self.stable_rounds
+                or self.scrolls >= self.max_scrolls
+                or self.elapsed() >= self.budget)
+
+    def metrics(self):
+        return {
+            'scrolls': self.scrolls,
+            'settle_seconds': round(self.elapsed(), 3),
+            'initial_cards': self.initial_cards,
+            'cards': self.cards,
+            'hit_budget': self.scrolls >= self.max_scrolls or self.elapsed() >= self.budget,
+        }
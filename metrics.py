@@ -0,0 +1,259 @@
+"""Per-phase timings and counters for scrape runs.
+
+    metrics = get_metrics()
+    with metrics.span("parse"):
+        products = parse_cards(html)
+    metrics.observe("products_per_page", len(products))
+    metrics.inc("captcha_hits")
+
+@timed("name") does the same for a whole function or coroutine.
+Spans and observations are summarized as count/sum/min/max; counters are
+plain totals. summary() gives a JSON-friendly dict, merge() adds one taken
+in another process, and write_prometheus() writes a textfile for
+node_exporter's textfile collector. Until enable() is
+called (or LAZADA_METRICS is set) get_metrics() returns NULL_METRICS,
+whose methods do nothing, so instrumented code costs one no-op call.
+"""
+import functools
+import inspect
+import json
+import os
+import re
+import threading
+import time
+from config import LAZADA_METRICS, LAZADA_METRICS_JSON, LAZADA_METRICS_PROM
+
+PROMETHEUS_PREFIX = "lazada_scrape"
+
+
+class _Stat:
+    __slots__ = ("count", "total", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, stat):
+        """Add a stat summarized by as_dict(), e.g. from another process"""
+        if not stat['count']:
+            return
+        self.count += stat['count']
+        self.total += stat['sum']
+        self.min = stat['min'] if self.min is None else min(self.min, stat['min'])
+        self.max = stat['max'] if self.max is None else max(self.max, stat['max'])
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'sum': round(self.total, 6),
+            'min': self.min,
+            'max': self.max,
+            'mean': round(self.total / self.count, 6) if self.count else None,
+        }
+
+
+class _Span:
+    __slots__ = ("metrics", "name", "started")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics._record(self.metrics.spans, self.name, time.perf_counter() - self.started)
+        return False
+
+
+class Metrics:
+    """Thread-safe registry of spans, counters and observations for one run"""
+
+    enabled = True
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.spans = {}
+        self.observations = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def _record(self, table, name, value):
+        with self._lock:
+            stat = table.get(name)
+            if stat is None:
+                stat = table[name] = _Stat()
+            stat.add(value)
+
+    def span(self, name):
+        """Context manager timing one occurrence of the phase name"""
+        return _Span(self, name)
+
+    def inc(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def observe(self, name, value):
+        self._record(self.observations, name, value)
+
+    def merge(self, summary):
+        """Add the spans, counters and observations of another registry's summary()"""
+        with self._lock:
+            for table, key in ((self.spans, 'spans'), (self.observations, 'observations')):
+                for name, stat in summary.get(key, {}).items():
+                    table.setdefault(name, _Stat()).merge(stat)
+            for name, value in summary.get('counters', {}).items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.spans.clear()
+            self.observations.clear()
+            self.counters.clear()
+
+    def summary(self):
+        with self._lock:
+            return {
+                'started_at': self.started_at,
+                'duration': round(time.time() - self.started_at, 3),
+                'spans': {name: stat.as_dict() for name, stat in sorted(self.spans.items())},
+                'counters': dict(sorted(self.counters.items())),
+                'observations': {name: stat.as_dict() for name, stat in sorted(self.observations.items())},
+            }
+
+    def prometheus_text(self, prefix=PROMETHEUS_PREFIX):
+        summary = self.summary()
+        lines = [
+            f"# HELP {prefix}_phase_seconds Time spent per scrape phase",
+            f"# TYPE {prefix}_phase_seconds summary",
+        ]
+        for name, stat in summary['spans'].items():
+            lines.append(f'{prefix}_phase_seconds_sum{{phase="{name}"}} {stat["sum"]}')
+            lines.append(f'{prefix}_phase_seconds_count{{phase="{name}"}} {stat["count"]}')
+        for name, value in summary['counters'].items():
+            metric = f"{prefix}_{_metric_name(name)}_total"
+            lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+        for name, stat in summary['observations'].items():
+            metric = f"{prefix}_{_metric_name(name)}"
+            lines += [f"# TYPE {metric} summary", f"{metric}_sum {stat['sum']}", f"{metric}_count {stat['count']}"]
+        lines += [f"# TYPE {prefix}_last_run_timestamp_seconds gauge",
+                  f"{prefix}_last_run_timestamp_seconds {summary['started_at']:.0f}"]
+        return "\n".join(lines) + "\n"
+
+    def write_json(self, path):
+        _write_atomic(path, json.dumps(self.summary(), indent=2) + "\n")
+
+    def write_prometheus(self, path):
+        _write_atomic(path, self.prometheus_text())
+
+    def export(self, json_path=LAZADA_METRICS_JSON, prom_path=LAZADA_METRICS_PROM):
+        """Write the configured outputs, errors are reported and ignored"""
+        for path, write in ((json_path, self.write_json), (prom_path, self.write_prometheus)):
+            if not path:
+                continue
+            try:
+                write(path)
+            except OSError as e:
+                print(f"Error writing metrics to {path}: {e}")
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class NullMetrics:
+    """Drop-in for Metrics that records nothing"""
+
+    enabled = False
+    _span = _NullSpan()
+
+    def span(self, name):
+        return self._span
+
+    def inc(self, name, amount=1):
+        pass
+
+    def observe(self, name, value):
+        pass
+
+    def merge(self, summary):
+        pass
+
+    def reset(self):
+        pass
+
+    def summary(self):
+        return {}
+
+    def export(self, json_path=None, prom_path=None):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+_active = NULL_METRICS
+
+
+def _metric_name(name):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def _write_atomic(path, text):
+    # The textfile collector may read at any moment, never let it see a partial file
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def get_metrics():
+    """The process-wide registry, NULL_METRICS while metrics are disabled"""
+    return _active
+
+
+def enable():
+    """Switch the process to a recording registry and return it"""
+    global _active
+    if not _active.enabled:
+        _active = Metrics()
+    return _active
+
+
+def timed(name):
+    """Decorator recording every call of a function or coroutine as span name"""
+    def decorate(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with _active.span(name):
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with _active.span(name):
+                    return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+if LAZADA_METRICS:
+    enable()
@@ -0,0 +1,235 @@
+"""Adaptive request pacing, one token bucket per host.
+
+    with get_pacer().request(url) as ticket:
+        response = page.goto(url)
+        if response.status == 429:
+            ticket.fail("error")
+
+Every tab, thread and task of a process shares get_pacer(), so together
+they never exceed the host's rate. The rate starts at `rate` requests per
+second and moves between min_rate and max_rate: each response faster than
+slow_response adds RATE_STEP, a slow one scales it by SLOW_FACTOR. A
+CAPTCHA or error halves it and pauses the host for `backoff` seconds,
+doubling up to max_backoff while failures keep coming. stats() reports
+the time spent waiting for a slot against the time spent on requests.
+Requests made with wait=False (replays) bypass the bucket entirely.
+"""
+import asyncio
+import contextlib
+import threading
+import time
+from urllib.parse import urlparse
+from config import (LAZADA_PACER_RATE, LAZADA_PACER_MIN_RATE, LAZADA_MIN_REQUEST_INTERVAL, LAZADA_PACER_BURST,
+                    LAZADA_PACER_SLOW_RESPONSE, LAZADA_PACER_BACKOFF, LAZADA_PACER_MAX_BACKOFF)
+from metrics import get_metrics
+
+# Additive increase per fast response (requests/sec) and multiplicative decrease per slow one
+RATE_STEP = 0.05
+SLOW_FACTOR = 0.7
+
+
+def max_rate_for(min_interval):
+    """Requests/sec allowed by a minimum interval between requests; 0 means no ceiling"""
+    if min_interval < 0:
+        raise ValueError(f"Minimum request interval must not be negative: {min_interval}")
+    return 1 / min_interval if min_interval else float('inf')
+
+
+def throttled(status):
+    """Whether an HTTP status means the host wants us to slow down"""
+    return status == 429 or status >= 500
+
+
+class HostBucket:
+    """Token bucket of one host; tokens are reserved ahead, so waiters are served in order"""
+
+    def __init__(self, host, rate, min_rate, max_rate, burst, slow_response, backoff, max_backoff):
+        self.host = host
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate = min(max(rate, min_rate), max_rate)
+        self.burst = burst
+        self.slow_response = slow_response
+        self.base_backoff = backoff
+        self.max_backoff = max_backoff
+        self.backoff = backoff
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.requests = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.work_seconds = 0.0
+        self.captchas = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token, returns the seconds to wait before using it"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            delay = max(-self.tokens / self.rate, self.paused_until - now, 0.0)
+            self.requests += 1
+            if delay:
+                self.waits += 1
+                self.wait_seconds += delay
+        return delay
+
+    def succeeded(self, seconds):
+        with self._lock:
+            self.work_seconds += seconds
+            if seconds > self.slow_response:
+                self.rate = max(self.min_rate, self.rate * SLOW_FACTOR)
+            else:
+                self.rate = min(self.max_rate, self.rate + RATE_STEP)
+            self.backoff = self.base_backoff
+
+    def failed(self, seconds, kind):
+        """Halve the rate and pause the host, pausing twice as long on the next failure"""
+        with self._lock:
+            self.work_seconds += seconds
+            if kind == "captcha":
+                self.captchas += 1
+            else:
+                self.errors += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.paused_until = max(self.paused_until, time.monotonic() + self.backoff)
+            self.backoff = min(self.max_backoff, self.backoff * 2)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'waits': self.waits,
+                'wait_seconds': round(self.wait_seconds, 3),
+                'work_seconds': round(self.work_seconds, 3),
+                'captchas': self.captchas,
+                'errors': self.errors,
+                'rate': round(self.rate, 3),
+            }
+
+
+class Ticket:
+    """Handed out by Pacer.request; fail() marks the response as a CAPTCHA or error"""
+
+    __slots__ = ("failure",)
+
+    def __init__(self):
+        self.failure = None
+
+    def fail(self, kind="error"):
+        self.failure = kind
+
+
+class Pacer:
+    def __init__(self, rate=LAZADA_PACER_RATE, min_rate=LAZADA_PACER_MIN_RATE,
+                 max_rate=max_rate_for(LAZADA_MIN_REQUEST_INTERVAL), burst=LAZADA_PACER_BURST,
+                 slow_response=LAZADA_PACER_SLOW_RESPONSE, backoff=LAZADA_PACER_BACKOFF,
+                 max_backoff=LAZADA_PACER_MAX_BACKOFF):
+        self.options = dict(rate=rate, min_rate=min_rate, max_rate=max_rate, burst=burst,
+                            slow_response=slow_response, backoff=backoff, max_backoff=max_backoff)
+        self.buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, url):
+        host = urlparse(url if "//" in url else "//" + url).netloc
+        with self._lock:
+            if host not in self.buckets:
+                self.buckets[host] = HostBucket(host, **self.options)
+            return self.buckets[host]
+
+    def _wait_time(self, bucket):
+        delay = bucket.reserve()
+        get_metrics().observe("pacer_wait", delay)
+        return delay
+
+    def _finish(self, bucket, ticket, started, error):
+        seconds = time.monotonic() - started
+        if error or ticket.failure:
+            bucket.failed(seconds, ticket.failure or "error")
+            get_metrics().inc("pacer_backoffs")
+        else:
+            bucket.succeeded(seconds)
+
+    @contextlib.contextmanager
+    def request(self, url, wait=True):
+        """Wait for a slot on url's host, then time the request made in the block.
+
+        An exception from the block counts as an error. With wait=False
+        nothing is reserved, counted or adapted, the request just runs.
+        """
+        if not wait:
+            yield Ticket()
+            return
+        bucket = self.bucket(url)
+        delay = self._wait_time(bucket)
+        if delay:
+            time.sleep(delay)
+        ticket = Ticket()
+        started = time.monotonic()
+        try:
+            yield ticket
+        except Exception:
+            self._finish(bucket, ticket, started, True)
+            raise
+        self._finish(bucket, ticket, started, False)
+
+    @contextlib.asynccontextmanager
+    async def request_async(self, url, wait=True):
+        if not wait:
+            yield Ticket()
+            return
+        bucket = self.bucket(url)
+        delay = self._wait_time(bucket)
+        if delay:
+            await asyncio.sleep(delay)
+        ticket = Ticket()
+        started = time.monotonic()
+        try:
+            yield ticket
+        except Exception:
+            self._finish(bucket, ticket, started, True)
+            raise
+        self._finish(bucket, ticket, started, False)
+
+    def penalize(self, url, kind="captcha"):
+        """Report a CAPTCHA or error noticed after the request finished"""
+        self.bucket(url).failed(0.0, kind)
+        get_metrics().inc("pacer_backoffs")
+
+    def stats(self):
+        """Per-host request, wait and work totals"""
+        with self._lock:
+            buckets = list(self.buckets.values())
+        return {bucket.host: bucket.stats() for bucket in buckets}
+
+    def summary(self):
+        lines = []
+        for host, stats in self.stats().items():
+            lines.append(f"Pacing {host}: {stats['requests']} requests, waited {stats['wait_seconds']:.1f}s, "
+                         f"worked {stats['work_seconds']:.1f}s, {stats['captchas']} CAPTCHAs, "
+                         f"{stats['errors']} errors, now {stats['rate']:.2f} req/s")
+        return "\n".join(lines)
+
+
+_pacer = None
+_pacer_lock = threading.Lock()
+
+
+def get_pacer():
+    """The process-wide Pacer"""
+    global _pacer
+    with _pacer_lock:
+        if _pacer is None:
+            _pacer = Pacer()
+        return _pacer
+
+
+def set_pacer(pacer):
+    """Replace the process-wide Pacer, e.g. with a share of the host's rate per worker process"""
+    global _pacer
+    with _pacer_lock:
+        _pacer = pacer
@@ -0,0 +1,206 @@
+"""Record a scraping session and replay it later without touching Lazada.
+
+Recorder keeps every document, xhr and fetch response of a page, plus the
+listing requests the scrapers make through Playwright's request API, and
+saves them as JSON. Replayer serves a recording (or a HAR file saved from
+the browser's dev tools or Playwright's record_har_path) through request
+routing, optionally after an injected delay, and answers the same request
+API calls from the recording. Requests missing from the recording get a
+404 so pages never hang on the network.
+
+The sync route handler sleeps on Playwright's dispatcher, so with the sync
+scraper concurrent requests of one page are delayed one after another;
+latency is therefore only applied to documents and listing requests.
+"""
+import asyncio
+import base64
+import json
+import threading
+import time
+from collections import Counter
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+RECORDING_VERSION = 1
+RECORDED_RESOURCE_TYPES = ("document", "xhr", "fetch")
+NOT_FOUND = {'status': 404, 'headers': {'content-type': 'text/plain'}, 'body': b"not recorded"}
+# Hop-by-hop and encoding headers describe the original transfer, not the stored body
+_DROPPED_HEADERS = {"content-encoding", "content-length", "transfer-encoding", "connection"}
+
+
+def normalize_url(url):
+    """Key for a URL: scheme-relative links resolved to https and query params sorted"""
+    if url.startswith("//"):
+        url = "https:" + url
+    parts = urlsplit(url)
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, query, ""))
+
+
+def _headers(headers):
+    return {name.lower(): value for name, value in headers.items() if name.lower() not in _DROPPED_HEADERS}
+
+
+def _decode(entry):
+    body = entry.get('body') or ""
+    if entry.get('encoding') == 'base64':
+        return base64.b64decode(body)
+    return body.encode('utf-8')
+
+
+def _encode(body):
+    if isinstance(body, str):
+        return body, None
+    try:
+        return body.decode('utf-8'), None
+    except UnicodeDecodeError:
+        return base64.b64encode(body).decode('ascii'), 'base64'
+
+
+class Recording:
+    """Responses keyed by method and normalized URL; the last one recorded wins"""
+
+    def __init__(self):
+        self.entries = {}
+        self._lock = threading.Lock()
+
+    def add(self, method, url, status, headers, body, resource_type=None):
+        text, encoding = _encode(body)
+        entry = {
+            'method': method.upper(), 'url': url, 'status': status, 'headers': _headers(headers),
+            'body': text, 'encoding': encoding, 'resource_type': resource_type,
+        }
+        with self._lock:
+            self.entries[(entry['method'], normalize_url(url))] = entry
+
+    def lookup(self, method, url):
+        return self.entries.get((method.upper(), normalize_url(url)))
+
+    def save(self, path):
+        with self._lock:
+            entries = list(self.entries.values())
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'version': RECORDING_VERSION, 'entries': entries}, f, ensure_ascii=False)
+        print(f"Recorded {len(entries)} responses to {path}")
+
+    @classmethod
+    def load(cls, path):
+        """Read our own format or a HAR file"""
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        recording = cls()
+        if 'log' in data:
+            for har_entry in data['log'].get('entries', []):
+                request, response = har_entry['request'], har_entry['response']
+                content = response.get('content', {})
+                body = content.get('text') or ""
+                if content.get('encoding') == 'base64':
+                    body = base64.b64decode(body)
+                headers = {header['name']: header['value'] for header in response.get('headers', [])}
+                recording.add(request['method'], request['url'], response['status'], headers, body,
+                              har_entry.get('_resourceType'))
+        else:
+            for entry in data.get('entries', []):
+                recording.entries[(entry['method'], normalize_url(entry['url']))] = entry
+        return recording
+
+
+class Recorder:
+    """Collects the responses of pages it is attached to"""
+
+    def __init__(self, path):
+        self.path = path
+        self.recording = Recording()
+
+    def _wanted(self, response):
+        return response.request.resource_type in RECORDED_RESOURCE_TYPES and not (300 <= response.status < 400)
+
+    def _on_response(self, response):
+        if not self._wanted(response):
+            return
+        try:
+            body = response.body()
+        except Exception as e:
+            print(f"Could not record {response.url}: {e}")
+            return
+        self.recording.add(response.request.method, response.url, response.status, response.headers,
+                           body, response.request.resource_type)
+
+    async def _on_response_async(self, response):
+        if not self._wanted(response):
+            return
+        try:
+            body = await response.body()
+        except Exception as e:
+            print(f"Could not record {response.url}: {e}")
+            return
+        self.recording.add(response.request.method, response.url, response.status, response.headers,
+                           body, response.request.resource_type)
+
+    def attach(self, page):
+        page.on("response", self._on_response)
+
+    def attach_async(self, page):
+        page.on("response", self._on_response_async)
+
+    def add(self, url, status, headers, body):
+        """Record a GET made through Playwright's request API, which pages never see"""
+        self.recording.add("GET", url, status, headers, body, "fetch")
+
+    def save(self):
+        self.recording.save(self.path)
+
+
+class Replayer:
+    """Serves a Recording through Playwright routing with optional injected latency"""
+
+    def __init__(self, path, latency=0.0):
+        self.recording = Recording.load(path)
+        self.latency = latency
+        self.served = Counter()
+        self.missed = 0
+
+    def _response(self, method, url, resource_type):
+        entry = self.recording.lookup(method, url)
+        if entry is None:
+            self.missed += 1
+            return NOT_FOUND, 0
+        self.served[resource_type or 'other'] += 1
+        delay = self.latency if resource_type in RECORDED_RESOURCE_TYPES else 0
+        return {'status': entry['status'], 'headers': entry['headers'], 'body': _decode(entry)}, delay
+
+    def handle(self, route):
+        request = route.request
+        response, delay = self._response(request.method, request.url, request.resource_type)
+        if delay:
+            time.sleep(delay)
+        route.fulfill(**response)
+
+    async def handle_async(self, route):
+        request = route.request
+        response, delay = self._response(request.method, request.url, request.resource_type)
+        if delay:
+            await asyncio.sleep(delay)
+        await route.fulfill(**response)
+
+    def install(self, target):
+        target.route("**/*", self.handle)
+
+    async def install_async(self, target):
+        await target.route("**/*", self.handle_async)
+
+    def fetch(self, url):
+        """(status, text) for a GET the scraper would make through the request API"""
+        response, delay = self._response("GET", url, "fetch")
+        if delay:
+            time.sleep(delay)
+        return response['status'], response['body'].decode('utf-8', 'replace')
+
+    async def fetch_async(self, url):
+        response, delay = self._response("GET", url, "fetch")
+        if delay:
+            await asyncio.sleep(delay)
+        return response['status'], response['body'].decode('utf-8', 'replace')
+
+    def summary(self):
+        served = ", ".join(f"{kind}={count}" for kind, count in sorted(self.served.items()))
+        return f"Replayed {sum(self.served.values())} responses ({served or 'none'}), {self.missed} not recorded"
@@ -0,0 +1,106 @@
+"""Playwright request interception that aborts resources the scraper never reads.
+
+Images, media, fonts and third-party trackers are aborted before they are
+downloaded; anything matching the allowlist (e.g. CAPTCHA assets) always
+loads. Aborted requests have no response, so bytes saved are estimated
+from typical per-type transfer sizes.
+"""
+from collections import Counter
+from urllib.parse import urlparse
+
+DEFAULT_BLOCKED_TYPES = ("image", "media", "font")
+
+DEFAULT_BLOCKED_HOSTS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "doubleclick.net",
+    "googlesyndication.com",
+    "facebook.net",
+    "connect.facebook.com",
+    "analytics.tiktok.com",
+    "mmstat.com",
+    "arms-retcode.aliyuncs.com",
+    "hotjar.com",
+)
+
+DEFAULT_ALLOWLIST = ("captcha", "punish", "nocaptcha")
+
+# Rough median transfer sizes per resource type, in bytes
+ESTIMATED_SIZES = {
+    "image": 15000,
+    "media": 250000,
+    "font": 30000,
+    "script": 20000,
+    "tracker": 5000,
+}
+
+
+class ResourcePolicy:
+    def __init__(self, blocked_types=DEFAULT_BLOCKED_TYPES, blocked_hosts=DEFAULT_BLOCKED_HOSTS,
+                 allowlist=DEFAULT_ALLOWLIST, estimated_sizes=None):
+        self.blocked_types = frozenset(blocked_types)
+        self.blocked_hosts = tuple(blocked_hosts)
+        self.allowlist = tuple(allowlist)
+        self.estimated_sizes = dict(ESTIMATED_SIZES, **(estimated_sizes or {}))
+        self.blocked = Counter()
+        self.allowed = 0
+
+    def _is_tracker(self, url):
+        host = urlparse(url).hostname or ""
+        return any(host == blocked or host.endswith("." + blocked) for blocked in self.blocked_hosts)
+
+    def classify(self, url, resource_type):
+        """The counter key a request is blocked under, or None to let it through"""
+        if any(pattern in url for pattern in self.allowlist):
+            return None
+        if self._is_tracker(url):
+            return "tracker"
+        if resource_type in self.blocked_types:
+            return resource_type
+        return None
+
+    def _decide(self, route):
+        request = route.request
+        kind = self.classify(request.url, request.resource_type)
+        if kind is None:
+            self.allowed += 1
+        else:
+            self.blocked[kind] += 1
+        return kind
+
+    def handle(self, route):
+        if self._decide(route) is None:
+            route.continue_()
+        else:
+            route.abort("blockedbyclient")
+
+    async def handle_async(self, route):
+        if self._decide(route) is None:
+            await route.continue_()
+        else:
+            await route.abort("blockedbyclient")
+
+    def install(self, target):
+        """Route every request of a sync Page or BrowserContext through the policy"""
+        target.route("**/*", self.handle)
+
+    async def install_async(self, target):
+        await target.route("**/*", self.handle_async)
+
+    def stats(self):
+        """{type: {'blocked': count, 'estimated_bytes_saved': bytes}}"""
+        return {
+            kind: {
+                'blocked': count,
+                'estimated_bytes_saved': count * self.estimated_sizes.get(kind, 0)
+            }
+            for kind, count in self.blocked.items()
+        }
+
+    def summary(self):
+        stats = self.stats()
+        blocked = sum(entry['blocked'] for entry in stats.values())
+        saved = sum(entry['estimated_bytes_saved'] for entry in stats.values())
+        details = ", ".join(f"{kind}={entry['blocked']}" for kind, entry in sorted(stats.items()))
+        return (f"Blocked {blocked} requests ({details or 'none'}), allowed {self.allowed}, "
+                f"~{saved / 1024 / 1024:.1f} MB saved")
@@ -0,0 +1,138 @@
+"""Long-lived scraper that keeps one browser warm between jobs.
+
+Jobs are queued with submit() and run one at a time on the service thread,
+which owns the Playwright instance (the sync API is not thread-safe). The
+browser context is replaced after max_jobs_per_context jobs or once the
+page's JS heap grows past max_heap_mb, and health() reports the state.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from config import LAZADA_SERVICE_MAX_JOBS_PER_CONTEXT, LAZADA_SERVICE_MAX_HEAP_MB
+from lazada_scraper import BASE_URL, LazadaScraper, skip_captcha
+from metrics import get_metrics
+
+
+class ScraperService:
+    def __init__(self, captcha_handler=skip_captcha, max_jobs_per_context=LAZADA_SERVICE_MAX_JOBS_PER_CONTEXT,
+                 max_heap_mb=LAZADA_SERVICE_MAX_HEAP_MB):
+        self.scraper = LazadaScraper(captcha_handler)
+        self.max_jobs_per_context = max_jobs_per_context
+        self.max_heap_mb = max_heap_mb
+        self.jobs = queue.Queue()
+        self.thread = None
+        self.started_at = None
+        self.jobs_done = 0
+        self.jobs_failed = 0
+        self.context_jobs = 0
+        self.contexts_recycled = 0
+        self.heap_mb = None
+        self.browser_connected = False
+        self.busy = False
+        self.last_error = None
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self.thread = threading.Thread(target=self._run, name="scraper-service", daemon=True)
+        self.thread.start()
+
+    def stop(self, wait=True):
+        self.jobs.put(None)
+        if wait and self.thread:
+            self.thread.join()
+
+    def submit(self, keyword, max_pages=3, username=None, password=None):
+        """Queue a scrape and return a Future resolving to its products"""
+        future = Future()
+        self.jobs.put((future, keyword, max_pages, username, password))
+        self.start()
+        return future
+
+    def health(self):
+        return {
+            'running': bool(self.thread and self.thread.is_alive()),
+            'browser_connected': self.browser_connected,
+            'busy': self.busy,
+            'uptime': time.time() - self.started_at if self.started_at else 0,
+            'jobs_queued': self.jobs.qsize(),
+            'jobs_done': self.jobs_done,
+            'jobs_failed': self.jobs_failed,
+            'context_jobs': self.context_jobs,
+            'contexts_recycled': self.contexts_recycled,
+            'heap_mb': self.heap_mb,
+            'last_error': self.last_error,
+        }
+
+    def _warm_up(self):
+        self.scraper._load_cookies()
+        self.scraper._goto(BASE_URL)
+        self.context_jobs = 0
+
+    def _measure_heap(self):
+        try:
+            used = self.scraper.page.evaluate("() => performance.memory ? performance.memory.usedJSHeapSize : 0")
+            self.heap_mb = used / 1024 / 1024
+        except Exception:
+            self.heap_mb = None
+
+    def _needs_recycle(self):
+        if self.context_jobs >= self.max_jobs_per_context:
+            return True
+        return self.heap_mb is not None and self.heap_mb > self.max_heap_mb
+
+    def _recycle(self):
+        print(f"Recycling browser context after {self.context_jobs} jobs (heap {self.heap_mb or 0:.0f} MB)")
+        self.scraper.new_context()
+        self._warm_up()
+        self.contexts_recycled += 1
+
+    def _ensure_browser(self):
+        browser = self.scraper.browser
+        if browser and browser.is_connected():
+            return
+        if self.scraper.playwright:
+            self.scraper.stop()
+        self.scraper.start()
+        self._warm_up()
+
+    def _run_job(self, keyword, max_pages, username, password):
+        self._ensure_browser()
+        if self._needs_recycle():
+            self._recycle()
+        if username and password and not self.scraper._is_logged_in():
+            self.scraper.login(username, password)
+
+        products = self.scraper.search_and_scrape(keyword, max_pages)
+        self.context_jobs += 1
+        self._measure_heap()
+        self.browser_connected = self.scraper.browser.is_connected()
+        return products
+
+    def _run(self):
+        self.started_at = time.time()
+        try:
+            while True:
+                job = self.jobs.get()
+                if job is None:
+                    break
+                future, keyword, max_pages, username, password = job
+                if not future.set_running_or_notify_cancel():
+                    continue
+
+                self.busy = True
+                try:
+                    future.set_result(self._run_job(keyword, max_pages, username, password))
+                    self.jobs_done += 1
+                except Exception as e:
+                    print(f"Scraper service job failed: {e}")
+                    self.last_error = str(e)
+                    self.jobs_failed += 1
+                    future.set_exception(e)
+                finally:
+                    self.busy = False
+                    get_metrics().export()
+        finally:
+            self.scraper.stop()
+            self.browser_connected = False
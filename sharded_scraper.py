@@ -0,0 +1,351 @@
+"""Keyword scraping sharded across processes, with one process writing the database.
+
+Each worker process runs its own browser and parser and asks the
+coordinator for one keyword at a time, so fast workers take more of the
+list. A keyword's products are one scrape run, so they travel as a single
+batch over a queue to the writer process, the only one with the database
+open; a keyword is finished once it is written. Keywords whose scrape or
+write failed are handed out again up to `retries` times, and a worker
+process that dies is replaced with its keyword requeued.
+
+Workers and the writer record metrics when the coordinator does and send
+them back with each keyword, to be merged into the coordinator's registry.
+
+Processes cannot share a pacer, so each of N workers paces itself at
+1/N of the configured per-host rates; together they stay within them.
+"""
+import multiprocessing
+import os
+import queue
+import time
+from collections import Counter, deque
+from config import (LAZADA_DB_NAME, LAZADA_HEADLESS, LAZADA_BROWSER_CHANNEL, LAZADA_PROCESSES,
+                    LAZADA_SHARD_RETRIES, LAZADA_PACER_RATE, LAZADA_PACER_MIN_RATE, LAZADA_MIN_REQUEST_INTERVAL)
+from metrics import enable as enable_metrics, get_metrics
+
+POLL_SECONDS = 1.0
+# How long the database writer gets to finish its queue once scraping is over
+WRITER_EXIT_SECONDS = 300
+
+
+def _send_metrics(events, worker_id):
+    """Hand what this process recorded since the last call to the coordinator"""
+    metrics = get_metrics()
+    if metrics.enabled:
+        events.put(('metrics', worker_id, None, metrics.summary()))
+        metrics.reset()
+
+
+def _worker_main(worker_id, tasks, events, writes, max_pages, headless, channel, collect, rate_share,
+                 record_metrics):
+    # Imported here so only the workers load Playwright
+    from lazada_scraper import LazadaScraper, skip_captcha
+    from pacer import Pacer, max_rate_for, set_pacer
+
+    if record_metrics:
+        enable_metrics()
+
+    set_pacer(Pacer(rate=LAZADA_PACER_RATE * rate_share, min_rate=LAZADA_PACER_MIN_RATE * rate_share,
+                    max_rate=rate_share * max_rate_for(LAZADA_MIN_REQUEST_INTERVAL)))
+    scraper = LazadaScraper(skip_captcha, headless=headless, channel=channel)
+    scraper.save_to_db = False
+    scraper.start()
+    try:
+        events.put(('ready', worker_id, None, None))
+        while True:
+            keyword = tasks.get()
+            if keyword is None:
+                break
+            captcha_hits = scraper.captcha_hits
+            products = scraper.search_and_scrape(keyword, max_pages)
+            # Sent ahead of the result, so the coordinator has it when the run ends
+            _send_metrics(events, worker_id)
+            if scraper.last_error:
+                events.put(('failed', worker_id, keyword, scraper.last_error))
+                # The browser may be what failed, give the next keyword a fresh one
+                scraper.stop()
+                scraper.start()
+                continue
+            if writes is not None:
+                writes.put((keyword, products))
+            events.put(('done', worker_id, keyword,
+                        (products if collect else len(products), scraper.captcha_hits - captcha_hits)))
+    finally:
+        scraper.stop()
+
+
+def _writer_main(db_name, writes, events, record_metrics):
+    from database import DatabaseManager
+
+    if record_metrics:
+        enable_metrics()
+    db = DatabaseManager(db_name)
+    while True:
+        batch = writes.get()
+        if batch is None:
+            break
+        keyword, products = batch
+        with get_metrics().span("db_write"):
+            stored = db.insert_products(keyword, products)
+        _send_metrics(events, None)
+        if stored is None:
+            events.put(('write_failed', None, keyword, "database write failed"))
+        else:
+            events.put(('written', None, keyword, stored))
+    db.manager.close()
+
+
+class ShardCoordinator:
+    def __init__(self, processes=LAZADA_PROCESSES, retries=LAZADA_SHARD_RETRIES, headless=LAZADA_HEADLESS,
+                 channel=LAZADA_BROWSER_CHANNEL, db_name=LAZADA_DB_NAME, save_to_db=True, collect=False,
+                 on_progress=None):
+        self.processes = processes or os.cpu_count() or 1
+        self.retries = retries
+        self.headless = headless
+        self.channel = channel
+        self.db_name = db_name
+        self.save_to_db = save_to_db
+        self.collect = collect
+        self.on_progress = on_progress or self._print_progress
+        self.workers = {}
+        self.results = {}
+        self.failed = {}
+        self.written = 0
+        self.total = 0
+
+    def _spawn(self, worker_id):
+        tasks = self._mp.Queue()
+        process = self._mp.Process(
+            target=_worker_main, name=f"scraper-worker-{worker_id}", daemon=True,
+            args=(worker_id, tasks, self._events, self._writes, self._max_pages,
+                  self.headless, self.channel, self.collect, 1 / self.processes, get_metrics().enabled)
+        )
+        process.start()
+        previous = self.workers.get(worker_id, {})
+        self.workers[worker_id] = {
+            'process': process, 'tasks': tasks, 'state': 'starting', 'keyword': None,
+            'done': previous.get('done', 0), 'failed': previous.get('failed', 0),
+            'products': previous.get('products', 0), 'captcha_hits': previous.get('captcha_hits', 0),
+            'restarts': previous.get('restarts', -1) + 1,
+        }
+
+    def _dispatch(self, worker_id):
+        worker = self.workers[worker_id]
+        # An exited worker gets nothing new; _check_workers restarts it
+        if self._pending and worker['process'].is_alive():
+            worker['keyword'] = self._pending.popleft()
+            worker['state'] = 'scraping'
+            self._in_flight.add(worker['keyword'])
+            worker['tasks'].put(worker['keyword'])
+        else:
+            worker['keyword'] = None
+            worker['state'] = 'idle'
+
+    def _dispatch_idle(self):
+        for worker_id, worker in self.workers.items():
+            if not self._pending:
+                break
+            if worker['state'] == 'idle':
+                self._dispatch(worker_id)
+
+    def _finish(self, keyword):
+        # A worker can die right after reporting, count each keyword once
+        if keyword not in self._finished:
+            self._finished.add(keyword)
+            self._outstanding -= 1
+
+    def _fail(self, keyword, error):
+        """Requeue keyword unless it has used up its retries"""
+        if keyword in self._finished:
+            return
+        self._attempts[keyword] += 1
+        if self._attempts[keyword] <= self.retries:
+            print(f"Retrying '{keyword}' ({self._attempts[keyword]}/{self.retries}) after: {error}")
+            self._pending.append(keyword)
+        else:
+            self.failed[keyword] = error
+            self._finish(keyword)
+
+    def _handle(self, kind, worker_id, keyword, payload):
+        if kind == 'metrics':
+            get_metrics().merge(payload)
+            return
+        if kind == 'written':
+            self.written += payload
+            self._finish(keyword)
+            return
+        if kind == 'write_failed':
+            # Scrape it again, the products never reached the database
+            self.results.pop(keyword, None)
+            self._fail(keyword, payload)
+            self._dispatch_idle()
+            self.on_progress(kind, worker_id, keyword, self.progress())
+            return
+        worker = self.workers[worker_id]
+        if kind in ('done', 'failed'):
+            self._in_flight.discard(keyword)
+        if kind == 'done':
+            products, captcha_hits = payload
+            count = len(products) if self.collect else products
+            self.results[keyword] = products
+            worker['done'] += 1
+            worker['products'] += count
+            worker['captcha_hits'] += captcha_hits
+            self.failed.pop(keyword, None)
+            if not self.save_to_db:
+                self._finish(keyword)
+            elif self._writer_error:
+                # Nothing is left to write it
+                self.results.pop(keyword)
+                self.failed[keyword] = self._writer_error
+                self._finish(keyword)
+        elif kind == 'failed':
+            worker['failed'] += 1
+            self._fail(keyword, payload)
+        self._dispatch(worker_id)
+        self._dispatch_idle()
+        if kind != 'ready':
+            self.on_progress(kind, worker_id, keyword, self.progress())
+
+    def _writer_exited(self):
+        """Fail every keyword whose products can no longer reach the database"""
+        self._writer_error = f"database writer exited with code {self._writer.exitcode}"
+        print(self._writer_error)
+        self._writer = None
+        for keyword in list(self.results):
+            if keyword not in self._finished:
+                del self.results[keyword]
+                self.failed[keyword] = self._writer_error
+                self._finish(keyword)
+        for keyword in self._pending:
+            self.failed[keyword] = self._writer_error
+            self._finish(keyword)
+        self._pending.clear()
+
+    def _check_workers(self):
+        # Take in what exited workers (and the writer) reported before they died first
+        while self._drain(0):
+            pass
+        if self._writer is not None and not self._writer.is_alive():
+            self._writer_exited()
+        for worker_id, worker in list(self.workers.items()):
+            if worker['state'] == 'stopped' or worker['process'].is_alive():
+                continue
+            error = f"worker exited with code {worker['process'].exitcode}"
+            if worker['keyword'] in self._in_flight:
+                # Only keywords that never got a result, the others are done or already requeued
+                self._in_flight.discard(worker['keyword'])
+                worker['failed'] += 1
+                self._fail(worker['keyword'], error)
+            if self._respawns_left and self._outstanding:
+                self._respawns_left -= 1
+                print(f"Worker {worker_id} {error}, restarting it")
+                self._spawn(worker_id)
+            else:
+                worker['state'] = 'stopped'
+                worker['keyword'] = None
+
+        if not any(worker['state'] != 'stopped' for worker in self.workers.values()):
+            # Nothing left to run the remaining keywords on
+            for keyword in self._pending:
+                self.failed[keyword] = "no workers left"
+                self._finish(keyword)
+            self._pending.clear()
+
+    def progress(self):
+        """Per-worker state and run totals"""
+        return {
+            'keywords': self.total,
+            'done': len(self.results),
+            'failed': len(self.failed),
+            'pending': len(self._pending),
+            'written': self.written,
+            'workers': {
+                worker_id: {key: value for key, value in worker.items()
+                            if key not in ('process', 'tasks')}
+                for worker_id, worker in self.workers.items()
+            },
+        }
+
+    def _print_progress(self, kind, worker_id, keyword, progress):
+        finished = progress['done'] + progress['failed']
+        if kind == 'done':
+            outcome = f"done ({progress['workers'][worker_id]['products']} products so far)"
+        else:
+            outcome = "failed" if keyword in self.failed else "failed, will retry"
+        source = "writer" if worker_id is None else f"worker {worker_id}"
+        print(f"[{finished}/{progress['keywords']}] {source}: '{keyword}' {outcome}")
+
+    def _drain(self, timeout):
+        try:
+            self._handle(*self._events.get(timeout=timeout))
+            return True
+        except queue.Empty:
+            return False
+
+    def run(self, keywords, max_pages=3):
+        """Scrape keywords, returns {keyword: products} (product counts unless collect)"""
+        keywords = list(dict.fromkeys(keywords))
+        self._mp = multiprocessing.get_context("spawn")
+        self._events = self._mp.Queue()
+        self._writes = self._mp.Queue() if self.save_to_db else None
+        self._max_pages = max_pages
+        self._pending = deque(keywords)
+        self._attempts = Counter()
+        # Keywords handed to a worker that has not reported done or failed for them yet
+        self._in_flight = set()
+        self._finished = set()
+        self._writer = None
+        self._writer_error = None
+        self._outstanding = self.total = len(keywords)
+        self._respawns_left = self.processes * (self.retries + 1)
+        started = time.monotonic()
+
+        writer = None
+        if self.save_to_db:
+            writer = self._writer = self._mp.Process(target=_writer_main, name="db-writer", daemon=True,
+                                                     args=(self.db_name, self._writes, self._events,
+                                                           get_metrics().enabled))
+            writer.start()
+        for worker_id in range(min(self.processes, len(keywords))):
+            self._spawn(worker_id)
+
+        try:
+            checked = time.monotonic()
+            while self._outstanding:
+                self._drain(POLL_SECONDS)
+                if time.monotonic() - checked >= POLL_SECONDS:
+                    self._check_workers()
+                    checked = time.monotonic()
+        finally:
+            for worker in self.workers.values():
+                if worker['process'].is_alive():
+                    worker['tasks'].put(None)
+            for worker in self.workers.values():
+                worker['process'].join(timeout=30)
+                if worker['process'].is_alive():
+                    worker['process'].terminate()
+            if writer:
+                self._writes.put(None)
+                # Keep reading its 'written' events so it can flush them and exit
+                deadline = time.monotonic() + WRITER_EXIT_SECONDS
+                while writer.is_alive() and time.monotonic() < deadline:
+                    self._drain(0.1)
+                    writer.join(timeout=0)
+                if writer.is_alive():
+                    writer.terminate()
+                while self._drain(0.1):
+                    pass
+
+        elapsed = time.monotonic() - started
+        print(f"Scraped {len(self.results)} of {self.total} keywords with {len(self.workers)} processes "
+              f"in {elapsed:.1f}s, {len(self.failed)} failed, {self.written} rows written")
+        return self.results
+
+    def captcha_hits(self):
+        return sum(worker['captcha_hits'] for worker in self.workers.values())
+
+
+def scrape_sharded(keywords, max_pages=3, **options):
+    """Blocking entry point, returns {keyword: product count}; options go to ShardCoordinator"""
+    return ShardCoordinator(**options).run(keywords, max_pages)
@@ -0,0 +1,66 @@
+"""parse_listing_json against saved search pages: it must agree with the card markup.
+
+Run with python -m unittest discover tests (or pytest).
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from card_parser import BACKENDS, available_backends, parse_cards, parse_listing_json, parse_products
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding="utf-8") as f:
+        return f.read()
+
+
+class BackendTest(unittest.TestCase):
+    def test_every_backend_installed(self):
+        # requirements.txt installs all of them; a failing import is a bug, not a skip
+        self.assertEqual(available_backends(), list(BACKENDS))
+
+    def test_backends_agree(self):
+        page = fixture("search_page.html")
+        expected = parse_cards(page, "bs4")
+        self.assertEqual(len(expected), 4)
+        for backend in BACKENDS:
+            with self.subTest(backend=backend):
+                self.assertEqual(parse_cards(page, backend), expected)
+
+
+class ListingJsonTest(unittest.TestCase):
+    def setUp(self):
+        if not available_backends():
+            self.skipTest("no HTML parser installed")
+        self.page = fixture("search_page.html")
+
+    def test_page_data_matches_cards(self):
+        listing = parse_listing_json(self.page)
+        self.assertEqual(len(listing), 4)
+        for backend in available_backends():
+            with self.subTest(backend=backend):
+                self.assertEqual(listing, parse_cards(self.page, backend))
+
+    def test_ajax_body_matches_cards(self):
+        self.assertEqual(parse_listing_json(fixture("search_ajax.json")), parse_cards(self.page))
+
+    def test_price_without_price_show_matches_card(self):
+        # The second item only has the numeric price
+        self.assertEqual(parse_listing_json(self.page)[1]['price'], "₱1,234.00")
+
+    def test_missing_payload(self):
+        page = fixture("search_page_no_payload.html")
+        self.assertIsNone(parse_listing_json(page))
+        self.assertEqual(parse_products(page), parse_cards(page))
+
+    def test_not_a_listing(self):
+        self.assertIsNone(parse_listing_json('{"mods": {}}'))
+        self.assertIsNone(parse_listing_json("<html><body>captcha</body></html>"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+"""DatabaseManager against a throwaway database file.
+
+Run with python -m unittest discover tests (or pytest).
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import ConnectionManager, DatabaseManager, parse_price_centavos, parse_sold_count
+
+
+def product(name, price, item_id, sold="10 sold"):
+    return {
+        'name': name,
+        'price': price,
+        'sold': sold,
+        'link': f"//www.lazada.com.ph/products/item-i{item_id}-s{item_id + 1}.html"
+    }
+
+
+class DatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.db = DatabaseManager(os.path.join(self.dir, "test.db"))
+
+    def tearDown(self):
+        self.db.manager.close()
+        ConnectionManager.close_all()
+        shutil.rmtree(self.dir)
+
+
+class ParseTest(unittest.TestCase):
+    def test_price_centavos(self):
+        for text, expected in (("₱1,234.50", 123450), ("₱99", 9900), ("PHP 12.30", 1230),
+                               ("₱1,234.00 - ₱2,000.00", 123400), ("", None), (None, None), ("Free", None)):
+            with self.subTest(text=text):
+                self.assertEqual(parse_price_centavos(text), expected)
+
+    def test_sold_count(self):
+        for text, expected in (("1.2K sold", 1200), ("10K+ sold", 10000), ("35 sold/month", 35),
+                               ("1,234 sold", 1234), ("2.5M sold", 2500000), ("5k sold", 5000),
+                               ("0 sold", 0), ("", 0), (None, 0)):
+            with self.subTest(text=text):
+                self.assertEqual(parse_sold_count(text), expected)
+
+
+class UnopenableDatabaseTest(unittest.TestCase):
+    def test_errors_instead_of_hanging(self):
+        db = DatabaseManager(os.path.join(tempfile.gettempdir(), "no such dir", "test.db"))
+        self.assertTrue(db.manager.closed)
+        self.assertIsNone(db.insert_products("phone", [product("Phone", "₱100.00", 1)]))
+        self.assertEqual(db.get_products("phone"), [])
+
+
+class SortTest(DatabaseTestCase):
+    def test_sort_uses_parsed_values(self):
+        self.db.insert_products("phone", [
+            product("A", "₱1,000.00", 1, sold="1.2K sold"),
+            product("B", "₱99.50", 2, sold="10K+ sold"),
+            product("C", "₱250.00", 3, sold="35 sold/month"),
+        ])
+        names = {option: [row[0] for row in self.db.get_products("phone", option)]
+                 for option in ("price_low_to_high", "price_high_to_low", "sold_high_to_low")}
+        self.assertEqual(names, {
+            'price_low_to_high': ["B", "C", "A"],
+            'price_high_to_low': ["A", "C", "B"],
+            'sold_high_to_low': ["B", "A", "C"],
+        })
+
+
+class QueryCacheTest(DatabaseTestCase):
+    def test_rename_under_another_keyword_invalidates(self):
+        self.db.insert_products("phone", [product("Old name", "₱100.00", 1)])
+        self.db.insert_products("case", [product("Other", "₱20.00", 2)])
+        self.assertEqual(self.db.get_products("phone")[0][0], "Old name")
+
+        # The same item found under another keyword, renamed
+        self.db.insert_products("charger", [product("New name", "₱100.00", 1)])
+        self.assertEqual(self.db.get_products("phone")[0][0], "New name")
+        self.assertEqual(self.db.get_products("case")[0][0], "Other")
+
+
+class PriceDropTest(DatabaseTestCase):
+    def test_repeated_item_keeps_first_occurrence(self):
+        self.db.insert_products("phone", [
+            product("Phone", "₱100.00", 1),
+            product("Case", "₱20.00", 2),
+            product("Phone", "₱50.00", 1),
+        ])
+        self.assertEqual(self.db.get_products("phone"), [
+            ("Phone", "₱100.00", "10 sold", product("Phone", "₱100.00", 1)['link']),
+            ("Case", "₱20.00", "10 sold", product("Case", "₱20.00", 2)['link']),
+        ])
+        self.assertEqual(self.db.get_price_drops("phone"), [])
+        self.assertEqual(self.db.get_price_stats("phone")[0]['product_count'], 2)
+
+    def test_drop_between_runs(self):
+        self.db.insert_products("phone", [product("Phone", "₱100.00", 1)])
+        self.db.insert_products("phone", [product("Phone", "₱50.00", 1)])
+        drops = self.db.get_price_drops("phone")
+        self.assertEqual([drop[1:4] for drop in drops], [(10000, 5000, 50.0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+"""HostBucket token accounting and rate adaptation, and the Pacer around it.
+
+Run with python -m unittest discover tests (or pytest).
+"""
+import math
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pacer import RATE_STEP, SLOW_FACTOR, HostBucket, Pacer, max_rate_for, throttled
+
+
+def bucket(**options):
+    defaults = dict(host="example.com", rate=1.0, min_rate=0.1, max_rate=2.0, burst=2,
+                    slow_response=5.0, backoff=10.0, max_backoff=40.0)
+    return HostBucket(**dict(defaults, **options))
+
+
+class HostBucketTest(unittest.TestCase):
+    def test_burst_then_wait(self):
+        host = bucket()
+        self.assertEqual(host.reserve(), 0.0)
+        self.assertEqual(host.reserve(), 0.0)
+        # Out of tokens: the next one is a second away at 1 request/sec, the one after two
+        self.assertAlmostEqual(host.reserve(), 1.0, places=2)
+        self.assertAlmostEqual(host.reserve(), 2.0, places=2)
+        self.assertEqual(host.stats()['requests'], 4)
+        self.assertEqual(host.stats()['waits'], 2)
+
+    def test_tokens_refill_over_time(self):
+        host = bucket()
+        host.reserve()
+        host.reserve()
+        host.updated -= 1.0
+        self.assertEqual(host.reserve(), 0.0)
+
+    def test_rate_starts_within_bounds(self):
+        self.assertEqual(bucket(rate=5.0).rate, 2.0)
+        self.assertEqual(bucket(rate=0.01).rate, 0.1)
+
+    def test_fast_response_adds_step(self):
+        host = bucket()
+        host.succeeded(0.5)
+        self.assertAlmostEqual(host.rate, 1.0 + RATE_STEP)
+
+    def test_slow_response_scales_down(self):
+        host = bucket()
+        host.succeeded(6.0)
+        self.assertAlmostEqual(host.rate, SLOW_FACTOR)
+
+    def test_rate_stays_between_min_and_max(self):
+        host = bucket()
+        for _ in range(100):
+            host.succeeded(0.1)
+        self.assertEqual(host.rate, 2.0)
+        for _ in range(100):
+            host.succeeded(60.0)
+        self.assertEqual(host.rate, 0.1)
+
+    def test_failure_halves_rate_and_pauses(self):
+        host = bucket()
+        host.failed(0.5, "captcha")
+        self.assertAlmostEqual(host.rate, 0.5)
+        self.assertGreater(host.reserve(), 9.0)
+        stats = host.stats()
+        self.assertEqual((stats['captchas'], stats['errors']), (1, 0))
+
+    def test_backoff_doubles_up_to_max_and_resets(self):
+        host = bucket()
+        pauses = []
+        for _ in range(4):
+            host.failed(0.0, "error")
+            pauses.append(host.paused_until - time.monotonic())
+        self.assertEqual([round(pause) for pause in pauses], [10, 20, 40, 40])
+        host.succeeded(0.1)
+        self.assertEqual(host.backoff, 10.0)
+
+
+class PacerTest(unittest.TestCase):
+    def test_max_rate_for(self):
+        self.assertEqual(max_rate_for(0.5), 2.0)
+        self.assertTrue(math.isinf(max_rate_for(0)))
+        with self.assertRaises(ValueError):
+            max_rate_for(-1)
+
+    def test_no_ceiling_keeps_growing(self):
+        pacer = Pacer(rate=1.0, max_rate=max_rate_for(0))
+        host = pacer.bucket("https://www.lazada.com.ph/catalog/")
+        for _ in range(100):
+            host.succeeded(0.1)
+        self.assertAlmostEqual(host.rate, 1.0 + 100 * RATE_STEP)
+
+    def test_one_bucket_per_host(self):
+        pacer = Pacer()
+        self.assertIs(pacer.bucket("https://www.lazada.com.ph/a"), pacer.bucket("www.lazada.com.ph/b"))
+        self.assertIsNot(pacer.bucket("https://www.lazada.com.ph/a"), pacer.bucket("https://acs-m.lazada.com.ph/"))
+
+    def test_failed_request_backs_off(self):
+        pacer = Pacer(rate=1.0, backoff=10.0)
+        url = "https://www.lazada.com.ph/"
+        with pacer.request(url) as ticket:
+            ticket.fail("captcha")
+        with self.assertRaises(RuntimeError):
+            with pacer.request(url, wait=False):
+                raise RuntimeError("not counted")
+        stats = pacer.stats()["www.lazada.com.ph"]
+        self.assertEqual((stats['requests'], stats['captchas'], stats['errors']), (1, 1, 0))
+
+    def test_throttled(self):
+        self.assertTrue(throttled(429))
+        self.assertTrue(throttled(503))
+        self.assertFalse(throttled(200))
+        self.assertFalse(throttled(404))
+
+
+if __name__ == "__main__":
+    unittest.main()